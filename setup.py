@@ -13,6 +13,7 @@ import os
 import sys
 
 from setuptools import find_packages, setup
+from setuptools.command.build_py import build_py
 
 readme = open('README.rst').read()
 
@@ -62,6 +63,24 @@ install_requires = [
 
 packages = find_packages()
 
+# Modules using ``async def``, a syntax error before Python 3.5
+ASYNC_MODULES = (
+    ('timegate', 'asgi'),
+    ('timegate.examples', 'asynchronous'),
+)
+
+
+class BuildPy(build_py):
+    """Leave the asynchronous modules out on Python versions before 3.5."""
+
+    def find_package_modules(self, package, package_dir):
+        """Return the modules of a package this Python can compile."""
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info >= (3, 5):
+            return modules
+        return [module for module in modules
+                if (module[0], module[1]) not in ASYNC_MODULES]
+
 
 # Get the version string. Cannot be done with import!
 g = {}
@@ -84,8 +103,14 @@ setup(
     include_package_data=True,
     platforms='any',
     entry_points={
+        'console_scripts': [
+            'timegate-warm = timegate.warm:main',
+        ],
         'timegate.handlers': [
+            'aggregate = timegate.aggregator:AggregatorHandler',
             'arxiv = timegate.examples.arxiv:ArxivHandler',
+            'asynchronous = '
+            'timegate.examples.asynchronous:AsyncExampleHandler',
             'aueb = timegate.examples.aueb:AuebHandler',
             'can = timegate.examples.can:CanHandler',
             'cat = timegate.examples.cat:CatHandler',
@@ -108,6 +133,7 @@ setup(
             'wikipedia = timegate.examples.wikipedia:WikipediaHandler',
         ],
     },
+    cmdclass={'build_py': BuildPy},
     extras_require=extras_require,
     install_requires=install_requires,
     setup_requires=setup_requires,
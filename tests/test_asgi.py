@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of TimeGate.
+# Copyright (C) 2016 CERN.
+#
+# TimeGate is free software; you can redistribute it and/or modify
+# it under the terms of the Revised BSD License; see LICENSE file for
+# more details.
+
+"""Tests of the ASGI application, which requires Python 3.5 or newer."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+
+
+@pytest.mark.parametrize('use_timemaps', [True, False])
+@pytest.mark.parametrize('handler_module', [
+    'timegate.examples.simple:ExampleHandler',
+    'timegate.examples.asynchronous:AsyncExampleHandler',
+])
+def test_asgi(app, handler_module, use_timemaps):
+    """Test the ASGI application."""
+    asyncio = pytest.importorskip('asyncio')
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+    from timegate.asgi import ASGIApplication
+
+    app.config.update(HANDLER_MODULE=handler_module,
+                      USE_TIMEMAPS=use_timemaps)
+    asgi_app = ASGIApplication(app, max_workers=2)
+    wsgi_client = Client(app, BaseResponse)
+
+    def request(path, headers=(), method='GET'):
+        messages = []
+        received = []
+
+        async def receive():
+            received.append(True)
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'method': method, 'path': path,
+            'query_string': b'', 'server': ('localhost', 80),
+            'headers': [(name.lower().encode('latin-1'),
+                         value.encode('latin-1')) for name, value in headers],
+        }
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(asgi_app(scope, receive, send))
+        finally:
+            loop.close()
+        assert received
+        assert messages[0]['type'] == 'http.response.start'
+        assert not messages[-1].get('more_body')
+        return messages[0]['status'], dict(
+            (name.decode('latin-1'), value.decode('latin-1'))
+            for name, value in messages[0]['headers']
+        ), b''.join(message.get('body', b'') for message in messages[1:])
+
+    for path, headers in (
+            ('/timegate/http://www.example.com/resourceA', [
+                ('Accept-Datetime', 'Mon, 01 Jan 2010 00:00:00 GMT')]),
+            ('/timegate/http://www.example.com/resourceA', [
+                ('Accept-Datetime', 'Mon, 01 Jan 1990 00:00:00 GMT')]),
+            ('/timegate/http://www.example.com/resourceA', [
+                ('Accept-Datetime', 'invalid')]),
+            ('/timegate/http://www.example.com/unknown', []),
+            ('/timemap/link/http://www.example.com/resourceA', []),
+            ('/timemap/json/http://www.example.com/resourceB', []),
+    ):
+        status, response_headers, body = request(path, headers)
+        expected = wsgi_client.get(path, headers=headers)
+        assert status == expected.status_code
+        assert response_headers.get('location') == \
+            expected.headers.get('Location')
+        if status == 200:
+            assert body == expected.data
+
+    assert request('/timegate/http://www.example.com/resourceA',
+                   method='HEAD')[2] == b''
+
+
+def test_asgi_single_flight():
+    """Test concurrent requests await an async handler once."""
+    asyncio = pytest.importorskip('asyncio')
+    from timegate.application import TimeGate
+    from timegate.asgi import ASGIApplication
+    from timegate.examples.asynchronous import AsyncExampleHandler
+
+    uri_r = 'http://www.example.com/resourceA'
+
+    class SlowHandler(AsyncExampleHandler):
+        calls = []
+
+        async def get_all_mementos(self, uri_r):
+            self.calls.append(uri_r)
+            await asyncio.sleep(0.1)
+            return await AsyncExampleHandler.get_all_mementos(self, uri_r)
+
+    handler = SlowHandler()
+    app = TimeGate(config=dict(
+        HANDLER_MODULE=handler,
+        CACHE_BACKEND='werkzeug.contrib.cache.SimpleCache',
+    ))
+    asgi_app = ASGIApplication(app, max_workers=4)
+    statuses = []
+
+    async def request():
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        await asgi_app({
+            'type': 'http', 'method': 'GET', 'query_string': b'',
+            'path': '/timemap/link/' + uri_r, 'headers': [],
+        }, receive, send)
+
+    async def requests():
+        await asyncio.gather(*[request() for _ in range(4)])
+        await request()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(requests())
+    finally:
+        loop.close()
+    assert statuses == [200] * 5
+    assert handler.calls == [uri_r]
+
+
+def test_asgi_concurrency():
+    """Test slow async handlers do not hold the threads."""
+    asyncio = pytest.importorskip('asyncio')
+    from timegate.application import TimeGate
+    from timegate.asgi import ASGIApplication
+    from timegate.examples.asynchronous import AsyncExampleHandler
+
+    class SlowHandler(AsyncExampleHandler):
+        calls = []
+        running = [0]
+
+        async def get_all_mementos(self, uri_r):
+            self.calls.append(uri_r)
+            self.running[0] += 1
+            self.running.append(self.running[0])
+            await asyncio.sleep(0.3)
+            self.running[0] -= 1
+            return await AsyncExampleHandler.get_all_mementos(
+                self, 'http://www.example.com/resourceA')
+
+    handler = SlowHandler()
+    app = TimeGate(config=dict(
+        HANDLER_MODULE=handler,
+        CACHE_BACKEND='werkzeug.contrib.cache.SimpleCache',
+    ))
+    asgi_app = ASGIApplication(app, max_workers=2)
+    uris = ['http://www.example.com/resource{0}'.format(i) for i in range(6)]
+    statuses = []
+
+    async def request(uri_r):
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        await asgi_app({
+            'type': 'http', 'method': 'GET', 'query_string': b'',
+            'path': '/timemap/link/' + uri_r, 'headers': [],
+        }, receive, send)
+
+    async def requests():
+        await asyncio.gather(*[request(uri_r) for uri_r in uris])
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(requests())
+    finally:
+        loop.close()
+    assert statuses == [200] * len(uris)
+    assert sorted(handler.calls) == uris
+    # All the calls were in flight together, not two at a time
+    assert max(handler.running) == len(uris)
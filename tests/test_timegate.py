@@ -29,17 +29,31 @@ def test_initialization():
     from timegate.examples.simple import ExampleHandler
     handler = ExampleHandler()
     app = TimeGate(config=dict(HANDLER_MODULE=handler))
-    assert len(list(app.url_map.iter_rules())) == 2
+    assert len(list(app.url_map.iter_rules())) == 4
 
 
-def test_application():
+def test_application(tmpdir, monkeypatch):
     """Test simple request."""
     from timegate import application
     from werkzeug.test import Client
     from werkzeug.wrappers import BaseResponse
+    monkeypatch.chdir(tmpdir.strpath)
     client = Client(application.application, BaseResponse)
 
     assert client.get('/').status_code == 404
+    assert application.get_app() is application.get_app()
+
+
+def test_create_app(tmpdir, monkeypatch):
+    """Test application factory."""
+    from timegate.application import DEFAULT_CONFIG_PATH, create_app
+    from werkzeug.contrib.cache import FileSystemCache
+    monkeypatch.chdir(tmpdir.strpath)
+    app = create_app(DEFAULT_CONFIG_PATH)
+
+    assert app.config['HOST'] == 'http://localhost'
+    assert isinstance(app.cache.backend, FileSystemCache)
+    assert None in app.handlers
 
 
 def test_multi_handler():
@@ -64,7 +78,7 @@ def test_multi_handler():
     ))
     client = Client(app, BaseResponse)
 
-    assert len(list(app.url_map.iter_rules())) == 4
+    assert len(list(app.url_map.iter_rules())) == 7
 
     parameters = [
         ('', base1_uri), (base1_uri, base1_uri), (base2_uri, base2_uri)
@@ -184,3 +198,1338 @@ def test_uri_validation_exceptions():
     from timegate.utils import validate_uristr
     with pytest.raises(Exception):
         validate_uristr(None)
+
+
+def test_best_binary_search():
+    """Test binary search matches the linear selection."""
+    from datetime import datetime, timedelta
+    from dateutil.tz import tzutc
+    from timegate.utils import best, closest, closest_before
+
+    start = datetime(2000, 1, 1, tzinfo=tzutc())
+    days = [0, 2, 2, 5, 9, 9, 9, 14]
+    timemap = [('http://example.com/v{0}'.format(i), start + timedelta(d))
+               for i, d in enumerate(days)]
+    for hours in range(-48, 24 * 16, 6):
+        accept_datetime = start + timedelta(hours=hours)
+        for timemap_type, linear in (('vcs', closest_before),
+                                     ('snapshot', closest)):
+            memento, prev_memento, next_memento = best(
+                timemap, accept_datetime, timemap_type
+            )
+            assert memento == linear(timemap, accept_datetime)
+            index = timemap.index(memento)
+            assert prev_memento == (timemap[index - 1] if index else None)
+            assert next_memento == (
+                timemap[index + 1] if index + 1 < len(timemap) else None
+            )
+
+
+def test_timegate_neighbour_links(client):
+    """Test prev and next memento links."""
+    response = client.get(
+        '/timegate/http://www.example.com/resourceA',
+        headers=[('Accept-Datetime', 'Mon, 01 Jan 2011 00:00:00 GMT'), ],
+    )
+    assert response.status_code == 302
+    link = response.headers['Link']
+    assert '<http://www.example.com/resourceA_v1>; ' \
+        'rel="first prev memento"' in link
+    assert '<http://www.example.com/resourceA_v2>; rel=memento' in link
+    assert '<http://www.example.com/resourceA_v3>; ' \
+        'rel="next last memento"' in link
+
+
+def test_timemap():
+    """Test compact TimeMap."""
+    import pickle
+    from datetime import datetime
+    from dateutil.tz import tzutc
+    from timegate.timemap import Timemap
+
+    timemap = Timemap.from_mementos([
+        ('http://example.com/v2', datetime(2010, 10, 16, 13, 27, 27)),
+        ('http://example.com/v1', datetime(1999, 9, 30, 1, 50, 50)),
+        ('http://example.com/v3', datetime(2015, 1, 3, tzinfo=tzutc())),
+    ])
+    assert len(timemap) == 3
+    assert timemap.first == (
+        'http://example.com/v1',
+        datetime(1999, 9, 30, 1, 50, 50, tzinfo=tzutc()),
+    )
+    assert timemap.last[0] == 'http://example.com/v3'
+    assert [uri for uri, _ in timemap] == [
+        'http://example.com/v1', 'http://example.com/v2',
+        'http://example.com/v3',
+    ]
+    assert timemap.bisect_left(datetime(2010, 10, 16, 13, 27, 27)) == 1
+    assert timemap.bisect_right(datetime(2010, 10, 16, 13, 27, 27)) == 2
+    assert timemap[1:] == Timemap(timemap.uris[1:], timemap.epochs[1:])
+    assert timemap[1:2].first == timemap[1]
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        assert pickle.loads(pickle.dumps(timemap, protocol)) == timemap
+    assert Timemap().first is None
+
+
+def test_timemap_link_streaming(app):
+    """Test link-format TimeMaps are streamed in chunks."""
+    from link_header import Link
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    app.config['TIMEMAP_CHUNK_SIZE'] = 16
+    app.cache.cache_rendered = False
+    client = Client(app, BaseResponse)
+    response = client.get('/timemap/link/http://www.example.com/resourceA')
+    assert response.status_code == 200
+    assert 'Content-Length' not in response.headers
+
+    mementos = [
+        ('resourceA_v1', 'first memento', 'Thu, 30 Sep 1999 01:50:50 GMT'),
+        ('resourceA_v2', 'memento', 'Sat, 16 Oct 2010 13:27:27 GMT'),
+        ('resourceA_v3', 'last memento', 'Sat, 03 Jan 2015 22:00:00 GMT'),
+    ]
+    expected = ',\n'.join(
+        str(Link('http://www.example.com/' + uri, rel=rel, datetime=date))
+        for uri, rel, date in mementos
+    ) + '\n'
+    assert response.data.decode('utf-8').endswith(expected)
+
+
+def test_timemap_compact_json(client):
+    """Test compact JSON TimeMaps."""
+    response = client.get('/timemap/cjson/http://www.example.com/resourceA')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/json'
+    data = json.loads(response.data.decode('utf-8'))
+    assert data['original_uri'] == 'http://www.example.com/resourceA'
+    assert data['mementos']['first'] == [
+        'http://www.example.com/resourceA_v1', 938656250
+    ]
+    assert data['mementos']['last'] == data['mementos']['list'][-1]
+    assert 3 == len(data['mementos']['list'])
+
+
+def test_timemap_pages(app):
+    """Test paged TimeMaps."""
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    app.config['TIMEMAP_PAGE_SIZE'] = 1
+    client = Client(app, BaseResponse)
+    base = 'http://localhost/timemap/{0}/{1}/{2}/resourceA'
+
+    response = client.get(
+        '/timemap/link/20000101000000/20991231235959/'
+        'http://www.example.com/resourceA'
+    )
+    assert response.status_code == 200
+    body = response.data.decode('utf-8')
+    assert body.count('memento') == 1
+    # Only the ends of the whole TimeMap are the first and last mementos
+    assert '<http://www.example.com/resourceA_v2>; rel=memento;' in body
+    assert '<{0}>; rel=prev'.format(
+        base.format('link', '19990930015050', '19990930015050')) in body
+    assert '<{0}>; rel=next'.format(
+        base.format('link', '20150103220000', '20991231235959')) in body
+
+    response = client.get(
+        '/timemap/json/20150101000000/20991231235959/resourceA'
+    )
+    assert response.status_code == 200
+    data = json.loads(response.data.decode('utf-8'))
+    assert len(data['mementos']['list']) == 1
+    assert list(data['pages']) == ['prev']
+    assert data['timemap_uri']['link_format'] == base.format(
+        'link', '20150101000000', '20991231235959')
+    assert data['timemap_uri']['cjson_format'] == base.format(
+        'cjson', '20150101000000', '20991231235959')
+    assert data['mementos']['first']['uri'] == \
+        'http://www.example.com/resourceA_v1'
+    assert data['mementos']['last'] == data['mementos']['list'][0]
+
+    response = client.get(
+        '/timemap/link/19990101000000/19991231235959/resourceA'
+    )
+    assert '<http://www.example.com/resourceA_v1>; rel="first memento";' \
+        in response.data.decode('utf-8')
+
+    response = client.get(
+        '/timemap/link/20160101000000/20991231235959/resourceA'
+    )
+    assert response.status_code == 404
+
+
+def test_paginate():
+    """Test pages never split mementos with the same datetime."""
+    from datetime import datetime
+    from timegate.timemap import Timemap, from_epoch
+    from timegate.utils import paginate
+
+    timemap = Timemap(['a', 'b', 'c', 'd', 'e'], [10, 20, 20, 20, 30])
+    page, prev_bounds, next_bounds = paginate(
+        timemap, from_epoch(0), from_epoch(100), 2)
+    assert page.uris == ['a']
+    assert prev_bounds is None
+    assert next_bounds == (from_epoch(20), from_epoch(100))
+
+    page, prev_bounds, next_bounds = paginate(
+        timemap, from_epoch(20), from_epoch(100), 2)
+    assert page.uris == ['b', 'c', 'd']
+    assert prev_bounds == (from_epoch(10), from_epoch(10))
+    assert next_bounds == (from_epoch(30), from_epoch(100))
+
+
+@pytest.mark.parametrize('compress_rendered', [False, True])
+def test_timemap_rendered_cache(app, compress_rendered):
+    """Test TimeMap bodies are served from cache."""
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    app.cache.compress_rendered = compress_rendered
+    client = Client(app, BaseResponse)
+    uri_r = 'http://www.example.com/resourceA'
+    for response_type in ('link', 'json', 'cjson'):
+        response = client.get('/timemap/{0}/{1}'.format(response_type, uri_r))
+        assert response.status_code == 200
+        timestamp, digest, body = app.cache.get_rendered(
+            uri_r, response_type, base_url='http://localhost/')
+        assert body == response.data
+        assert response.headers['Content-Length'] == str(len(body))
+
+    timemap = app.cache.get_all(uri_r)
+    app.cache.set_rendered(uri_r, 'link', b'cached', timemap,
+                           base_url='http://localhost/')
+    response = client.get('/timemap/link/{0}'.format(uri_r))
+    assert response.data == b'cached'
+    assert response.headers['Content-Type'] == 'application/link-format'
+    assert response.headers['ETag'] == '"{0}"'.format(timemap.digest)
+
+    # Bodies are rendered for each host and script name.
+    for base_url in ('https://other.example.org/', 'http://localhost/tg/'):
+        response = client.get('/timemap/link/{0}'.format(uri_r),
+                              base_url=base_url)
+        assert response.data != b'cached'
+        assert '<{0}timegate/'.format(base_url).encode('utf-8') in \
+            response.data
+        assert app.cache.get_rendered(
+            uri_r, 'link', base_url=base_url)[2] == response.data
+
+    # Storing a new TimeMap discards its rendered bodies.
+    app.cache.set(uri_r, app.cache.get_all(uri_r))
+    for base_url in ('http://localhost/', 'https://other.example.org/'):
+        assert app.cache.get_rendered(uri_r, 'link',
+                                      base_url=base_url) is None
+
+
+@pytest.mark.parametrize('path', [
+    '/timemap/link/http://www.example.com/resourceA',
+    '/timemap/json/20000101000000/20991231235959/resourceA',
+    '/timegate/http://www.example.com/resourceA',
+])
+def test_conditional_requests(app, path):
+    """Test ETag and Last-Modified validators."""
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    client = Client(app, BaseResponse)
+    response = client.get(path)
+    assert response.status_code in (200, 302)
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+
+    for headers in ([('If-None-Match', etag)],
+                    [('If-Modified-Since', last_modified)]):
+        response = client.get(path, headers=headers)
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert response.data == b''
+
+    response = client.get(path, headers=[('If-None-Match', '"other"')])
+    assert response.status_code in (200, 302)
+
+
+def test_timegate_etag_depends_on_memento(client):
+    """Test TimeGate entity tags differ between selected mementos."""
+    uri = '/timegate/http://www.example.com/resourceA'
+    etags = set(
+        client.get(uri, headers=[('Accept-Datetime', date)]).headers['ETag']
+        for date in ('Mon, 01 Jan 1999 00:00:00 GMT',
+                     'Mon, 01 Jan 2011 00:00:00 GMT',
+                     'Mon, 01 Jan 2016 00:00:00 GMT')
+    )
+    assert len(etags) == 3
+
+
+@pytest.mark.parametrize('keep_alive', [True, False])
+def test_keep_alive(app, keep_alive):
+    """Test the Connection header follows the configuration."""
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    app.config['KEEP_ALIVE'] = keep_alive
+    client = Client(app, BaseResponse)
+    for path in ('/timegate/http://www.example.com/resourceA',
+                 '/timemap/link/http://www.example.com/resourceA',
+                 '/timemap/json/http://www.example.com/resourceBad'):
+        response = client.get(path)
+        assert response.headers.get('Connection') == (
+            None if keep_alive else 'close'
+        )
+
+
+def test_http_date():
+    """Test RFC 1123 dates match werkzeug formatting."""
+    from datetime import datetime
+    from dateutil.tz import tzoffset
+    from werkzeug.http import http_date as werkzeug_http_date
+    from timegate.utils import http_date
+
+    for epoch in (-86401, -1, 0, 59, 86399, 86400, 951782400, 4102444799,
+                  1234567890, 1234567890):
+        assert http_date(epoch) == werkzeug_http_date(epoch)
+    value = datetime(2016, 2, 29, 23, 59, 59, 999999)
+    assert http_date(value) == werkzeug_http_date(value)
+    # RFC 1123 years have four digits
+    assert http_date(datetime(999, 1, 1, 12, 0)) == \
+        'Tue, 01 Jan 0999 12:00:00 GMT'
+    value = datetime(2016, 3, 1, 1, 0, tzinfo=tzoffset(None, 7200))
+    assert http_date(value) == 'Mon, 29 Feb 2016 23:00:00 GMT'
+
+
+@pytest.mark.parametrize('strict', [True, False])
+def test_accept_datetime_parsing(app, strict):
+    """Test Accept-Datetime parsing honours strict mode."""
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+    from timegate.errors import DateTimeError
+    from timegate.utils import parse_http_date
+
+    expected = parse_http_date('Fri, 01 Jan 2010 00:00:00 GMT')
+    assert expected.tzinfo is not None
+    assert parse_http_date(' Fri, 01 Jan 2010 00:00:00 GMT ') == expected
+    for value in ('Friday, 01-Jan-10 00:00:00 GMT', '2010-01-01',
+                  'Fri Jan  1 00:00:00 2010'):
+        if strict:
+            with pytest.raises(DateTimeError):
+                parse_http_date(value, strict=strict)
+        else:
+            assert parse_http_date(value, strict=strict) == expected
+    for value in ('', 'Fri, 1 Jan 2010 00:00:00 GMT',
+                  'Fri, 32 Jan 2010 00:00:00 GMT',
+                  'Fri, 01 Foo 2010 00:00:00 GMT', 'not a date'):
+        with pytest.raises(DateTimeError):
+            parse_http_date(value)
+
+    app.config['STRICT_TIME'] = strict
+    client = Client(app, BaseResponse)
+    response = client.get(
+        '/timegate/http://www.example.com/resourceA',
+        headers=[('Accept-Datetime', '2010-01-01')],
+    )
+    assert response.status_code == (400 if strict else 302)
+
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_timegate_batch(app, ndjson):
+    """Test batch TimeGate requests."""
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    app.url_map  # register the handlers
+    handler = app.handlers[None]
+    calls = []
+    get_all_mementos = handler.get_all_mementos
+
+    def counting_get_all_mementos(uri_r):
+        calls.append(uri_r)
+        return get_all_mementos(uri_r)
+
+    handler.get_all_mementos = counting_get_all_mementos
+    items = [
+        {'uri_r': 'http://www.example.com/resourceA',
+         'accept_datetime': 'Mon, 01 Jan 2011 00:00:00 GMT'},
+        ['resourceB', 'Mon, 01 Jan 1999 00:00:00 GMT'],
+        ['http://www.example.com/resourceA'],
+        {'uri_r': 'http://www.example.com/resourceA',
+         'accept_datetime': 'Fri, 01 Jan 1999 00:00:00 GMT'},
+        ['http://www.example.com/unknown'],
+        ['http://www.example.com/resourceB', 'yesterday'],
+    ]
+    if ndjson:
+        data = '\n'.join(json.dumps(item) for item in items)
+        content_type = 'application/x-ndjson'
+    else:
+        data = json.dumps(items)
+        content_type = 'application/json'
+    client = Client(app, BaseResponse)
+    response = client.post('/timegate/batch', data=data,
+                           content_type=content_type)
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == content_type
+    text = response.get_data(as_text=True)
+    if ndjson:
+        results = [json.loads(line) for line in text.splitlines()]
+    else:
+        results = json.loads(text)
+
+    assert sorted(calls) == [
+        'http://www.example.com/resourceA',
+        'http://www.example.com/resourceB',
+        'http://www.example.com/unknown',
+    ]
+    assert [result.get('memento', {}).get('uri') for result in results] == [
+        'http://www.example.com/resourceA_v2',
+        'http://www.example.com/resourceB_v1',
+        'http://www.example.com/resourceA_v3',
+        'http://www.example.com/resourceA_v1',
+        None,
+        None,
+    ]
+    assert results[0]['uri_r'] == 'http://www.example.com/resourceA'
+    assert results[0]['memento']['datetime'] == \
+        'Sat, 16 Oct 2010 13:27:27 GMT'
+    assert results[0]['first']['uri'] == 'http://www.example.com/resourceA_v1'
+    assert results[0]['last']['uri'] == 'http://www.example.com/resourceA_v3'
+    assert results[1]['uri_r'] == 'http://www.example.com/resourceB'
+    assert results[4]['status'] == 404
+    assert results[5]['status'] == 400
+
+    for data in ('{}', '[1]', '[{"accept_datetime": null}]', 'nope'):
+        response = client.post('/timegate/batch', data=data,
+                               content_type='application/json')
+        assert response.status_code == 400
+    app.config['BATCH_MAX_SIZE'] = 1
+    response = client.post('/timegate/batch', data=json.dumps(items),
+                           content_type='application/json')
+    assert response.status_code == 413
+    assert client.get('/timegate/batch').status_code != 200
+
+
+def test_resource_links_cache(client):
+    """Test rendered links are memoized per URI-R and host."""
+    uri = '/timegate/http://www.example.com/resourceA'
+    timemap = '/timemap/link/http://www.example.com/resourceA'
+    for base_url in ('http://localhost/', 'https://other.example.org/tg/'):
+        for _ in range(2):
+            link = client.get(uri, base_url=base_url).headers['Link']
+            assert link.startswith(
+                '<http://www.example.com/resourceA>; rel=original, '
+                '<{0}timemap/link/resourceA>; rel=timemap; '
+                'type=application/link-format, '
+                '<{0}timemap/json/resourceA>; rel=timemap; '
+                'type=application/json, '.format(base_url)
+            )
+            body = client.get(timemap, base_url=base_url).data
+            assert '<{0}timegate/resourceA>; rel=timegate'.format(
+                base_url).encode('utf-8') in body
+
+    handler = client.application.handlers[None]
+    info = handler.resource_links.cache_info()
+    assert info.currsize == 2
+    # The second TimeMap of each host is the rendered body cached for it
+    assert info.hits == 4
+
+
+@pytest.mark.parametrize('compress_rendered', [False, True])
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+def test_timemap_content_encoding(app, compress_rendered, encoding):
+    """Test TimeMap responses are compressed when clients accept it."""
+    import zlib
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    def decompress(data):
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS
+                               if encoding == 'gzip' else zlib.MAX_WBITS)
+
+    app.cache.compress_rendered = compress_rendered
+    client = Client(app, BaseResponse)
+    uri_r = 'http://www.example.com/resourceA'
+    path = '/timemap/link/{0}'.format(uri_r)
+    accept = [('Accept-Encoding', '{0}, identity;q=0.5'.format(encoding))]
+
+    identity = client.get(path)
+    assert identity.headers['Vary'] == 'accept-encoding'
+    assert 'Content-Encoding' not in identity.headers
+    assert client.get(path, headers=[
+        ('Accept-Encoding', '{0};q=0'.format(encoding))
+    ]).data == identity.data
+
+    for _ in range(2):
+        response = client.get(path, headers=accept)
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == encoding
+        assert response.headers['Vary'] == 'accept-encoding'
+        assert response.headers['ETag'] != identity.headers['ETag']
+        assert decompress(response.data) == identity.data
+        assert app.cache.get_rendered(
+            uri_r, 'link', encoding, base_url='http://localhost/')[2] == \
+            response.data
+
+    response = client.get(path, headers=accept + [
+        ('If-None-Match', response.headers['ETag'])
+    ])
+    assert response.status_code == 304
+    assert response.headers['Vary'] == 'accept-encoding'
+    assert client.get(path, headers=[
+        ('If-None-Match', response.headers['ETag'])
+    ]).status_code == 200
+
+    # Bodies that are not cached are compressed while streamed.
+    for path in ('/timemap/json/{0}'.format(uri_r),
+                 '/timemap/json/20000101000000/20991231235959/resourceA'):
+        expected = client.get(path, headers=[('Cache-Control', 'no-cache')])
+        response = client.get(path, headers=accept + [
+            ('Cache-Control', 'no-cache')
+        ])
+        assert response.headers['Content-Encoding'] == encoding
+        assert decompress(response.data) == expected.data
+
+
+def test_aggregator(tmpdir, monkeypatch):
+    """Test the aggregator merges the TimeMaps of several handlers."""
+    import time
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+    from timegate.aggregator import AggregatorHandler
+    from timegate.application import TimeGate
+    from timegate.config import Config
+    from timegate.errors import HandlerError
+    from timegate.examples.simple import ExampleHandler
+    from timegate.handler import parsed_request
+
+    class MirrorHandler(ExampleHandler):
+        def get_all_mementos(self, uri_r):
+            if not uri_r.endswith('resourceA'):
+                return []
+            return [('http://www.example.com/resourceA_v2',
+                     '2010-10-16T13:27:27Z'),
+                    ('http://mirror.example.org/resourceA',
+                     '2012-01-01T00:00:00Z')]
+
+    class SlowHandler(ExampleHandler):
+        def get_all_mementos(self, uri_r):
+            time.sleep(1)
+            return [('http://slow.example.org/resourceA',
+                     '2012-01-01T00:00:00Z')]
+
+    class BrokenHandler(ExampleHandler):
+        def get_all_mementos(self, uri_r):
+            raise HandlerError('Broken', 502)
+
+    handler = AggregatorHandler(handlers=[
+        'timegate.examples.simple:ExampleHandler', MirrorHandler(),
+        SlowHandler(), BrokenHandler(),
+    ], timeout=0.2)
+    mementos = handler.get_all_mementos('http://www.example.com/resourceA')
+    assert [uri for uri, _ in mementos] == [
+        'http://www.example.com/resourceA_v1',
+        'http://www.example.com/resourceA_v2',
+        'http://mirror.example.org/resourceA',
+        'http://www.example.com/resourceA_v3',
+    ]
+    assert len(handler.get_all_mementos('http://www.example.com/unknown')) \
+        == 0
+    with pytest.raises(HandlerError):
+        AggregatorHandler(handlers=[
+            SlowHandler(), BrokenHandler()
+        ], timeout=0.1).get_all_mementos('http://www.example.com/resourceA')
+
+    # Handlers may have their own timeout.
+    slow = SlowHandler()
+    mementos = AggregatorHandler(
+        handlers=[MirrorHandler(), slow], timeout=0.1, timeouts={slow: 5},
+    ).get_all_mementos('http://www.example.com/resourceA')
+    assert 'http://slow.example.org/resourceA' in mementos.uris
+
+    # Merged TimeMaps are not checked against the size of one archive.
+    monkeypatch.setattr('timegate.handler.TM_MAX_SIZE', 3)
+    assert len(parsed_request(AggregatorHandler(handlers=[
+        'timegate.examples.simple:ExampleHandler', MirrorHandler(),
+    ]).get_all_mementos, 'http://www.example.com/resourceA')) == 4
+    monkeypatch.undo()
+
+    config_path = tmpdir.join('config.ini')
+    config_path.write('\n'.join([
+        '[server]', 'host = http://localhost', 'strict_datetime = true',
+        '[handler]', 'handler_class = aggregate',
+        'handlers = timegate.examples.simple:ExampleHandler, simple',
+        'handler_timeout = 2.5', 'use_timemap = true', 'is_vcs = false',
+        'handler_timeouts = simple = 4, other=1',
+        'base_uri = http://www.example.com/',
+        '[handler:mirror]',
+        'handler_class = timegate.examples.simple:ExampleHandler',
+        'use_timemap = true', 'is_vcs = false',
+        'base_uri = http://mirror.example.org/',
+        '[cache]', 'cache_backend = werkzeug.contrib.cache:NullCache',
+        'cache_refresh_time = 86400',
+    ]))
+    config = Config(None)
+    config.from_inifile(config_path.strpath)
+    assert config['HANDLER_OPTIONS'] == dict(handlers=[
+        'timegate.examples.simple:ExampleHandler', 'simple'
+    ], timeout=2.5, timeouts=dict(simple=4, other=1))
+    # Named handlers do not inherit the options of the default one.
+    assert config['HANDLERS']['mirror']['HANDLER_OPTIONS'] == {}
+    config['HANDLER_MODULE'] = 'timegate.aggregator:AggregatorHandler'
+    app = TimeGate(config=config)
+    response = Client(app, BaseResponse).get(
+        '/timegate/resourceA',
+        headers=[('Accept-Datetime', 'Mon, 01 Jan 2010 00:00:00 GMT')],
+    )
+    assert response.status_code == 302
+    assert response.headers['Location'] == \
+        'http://www.example.com/resourceA_v2'
+    assert app.handlers[None].timeouts == [2.5, 4]
+    assert isinstance(app.handlers['mirror'], ExampleHandler)
+
+
+@pytest.mark.parametrize('backend', [
+    'werkzeug.contrib.cache:FileSystemCache',
+    'werkzeug.contrib.cache:SimpleCache',
+    'timegate.backends:MmapFileSystemCache',
+])
+def test_single_flight(tmpdir, backend):
+    """Test concurrent fetches of a TimeMap are coalesced."""
+    import threading
+    import time
+    from timegate.cache import Cache
+    from timegate.errors import HandlerError
+    from timegate.timemap import Timemap
+
+    options = dict(cache_dir=tmpdir.strpath) if 'FileSystem' in backend \
+        else {}
+    calls = []
+
+    def fetch(delay=0.2, error=None):
+        def fetch():
+            calls.append(threading.current_thread().name)
+            time.sleep(delay)
+            if error:
+                raise error
+            timemap = Timemap(['http://www.example.com/resourceA_v1'], [0])
+            caches[0].set('http://www.example.com/resourceA', timemap)
+            return timemap
+        return fetch
+
+    def run(cache, fetch, results):
+        try:
+            results.append(cache.single_flight(
+                'http://www.example.com/resourceA', fetch
+            ))
+        except HandlerError as e:
+            results.append(e)
+
+    def run_concurrently(targets):
+        threads = [threading.Thread(target=run, args=args)
+                   for args in targets]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+
+    # Threads of a process share the fetch of the first one.
+    caches = [Cache(backend, **options)]
+    results = []
+    run_concurrently([(caches[0], fetch(), results)] * 5)
+    assert len(calls) == 1
+    assert len(results) == 5 and all(
+        result == results[0] for result in results
+    )
+
+    # So do the exceptions.
+    del calls[:], results[:]
+    error = HandlerError('Not Found', 404)
+    run_concurrently([(caches[0], fetch(error=error), results)] * 3)
+    assert len(calls) == 1
+    assert results == [error] * 3
+
+    # Other processes, with their own Cache object, wait for the backend
+    # lock and use the TimeMap stored by its holder.
+    if 'FileSystem' in backend:
+        del calls[:], results[:]
+        caches.append(Cache(backend, **options))
+        run_concurrently([(cache, fetch(), results) for cache in caches])
+        assert len(calls) == 1
+        assert results[0] == results[1]
+        assert not tmpdir.listdir(lambda path: '.lock' in path.basename)
+
+    # Callers give up waiting after fetch_wait_timeout seconds.
+    del calls[:], results[:]
+    caches[0].fetch_wait_timeout = 0.05
+    run_concurrently([(caches[0], fetch(), results)] * 2)
+    assert len(calls) == 2
+
+
+def test_stale_while_revalidate():
+    """Test stale TimeMaps are served while they are refreshed."""
+    import threading
+    import time
+    from datetime import timedelta
+    from timegate.cache import Cache
+    from timegate.timemap import Timemap
+
+    uri_r = 'http://www.example.com/resourceA'
+    cache = Cache('werkzeug.contrib.cache:SimpleCache',
+                  cache_refresh_time=60, stale_while_revalidate=60,
+                  refresh_jitter=0)
+    cache.set(uri_r, Timemap([uri_r + '_v1'], [0]))
+    timestamp = cache.get_all(uri_r).timestamp
+    calls = []
+    release = threading.Event()
+
+    def refresh():
+        calls.append(uri_r)
+        release.wait()
+        timemap = Timemap([uri_r + '_v2'], [1])
+        cache.set(uri_r, timemap)
+        return timemap
+
+    stale = timestamp + timedelta(seconds=90)
+    assert cache.get_until(uri_r, stale) is None
+    for _ in range(3):
+        timemap = cache.get_until(uri_r, stale, refresh=refresh)
+        assert timemap.uris == [uri_r + '_v1']
+        assert timemap.timestamp == timestamp
+    assert cache.get_until(uri_r, timestamp + timedelta(seconds=121),
+                           refresh=refresh) is None
+
+    release.set()
+    for _ in range(100):
+        if cache.get_all(uri_r) and not cache._revalidating:
+            break
+        time.sleep(0.01)
+    assert cache.get_all(uri_r).uris == [uri_r + '_v2']
+    assert calls == [uri_r]
+
+    # Expiry dates are spread over the jitter.
+    cache = Cache('werkzeug.contrib.cache:NullCache',
+                  cache_refresh_time=1000)
+    expires = set(cache._expires('{0}{1}'.format(uri_r, index), timestamp)
+                  for index in range(20))
+    assert len(expires) == 20
+    assert all(timestamp + timedelta(seconds=900) <= value <=
+               timestamp + timedelta(seconds=1000) for value in expires)
+
+
+def test_stale_rendered_timemaps():
+    """Test stale rendered bodies are served while they are refreshed."""
+    import threading
+    import time
+    from timegate.application import TimeGate
+    from timegate.examples.simple import ExampleHandler
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    uri_r = 'http://www.example.com/resourceA'
+    release = threading.Event()
+
+    class SlowHandler(ExampleHandler):
+        calls = []
+
+        def get_all_mementos(self, uri_r):
+            self.calls.append(uri_r)
+            if len(self.calls) > 1:
+                release.wait()
+            return ExampleHandler.get_all_mementos(self, uri_r)
+
+    handler = SlowHandler()
+    # TimeMaps expire as soon as they are cached
+    app = TimeGate(config=dict(
+        HANDLER_MODULE=handler,
+        CACHE_BACKEND='werkzeug.contrib.cache.SimpleCache',
+        CACHE_REFRESH_TIME=0,
+        CACHE_OPTIONS=dict(stale_while_revalidate=60),
+    ))
+    client = Client(app, BaseResponse)
+    rendered = []
+    set_rendered = app.cache.set_rendered
+    app.cache.set_rendered = lambda *args, **kwargs: rendered.append(
+        set_rendered(*args, **kwargs))
+
+    body = client.get('/timemap/link/' + uri_r).data
+    assert len(rendered) == 1
+    timestamp = app.cache.peek(uri_r).timestamp
+    for _ in range(3):
+        assert client.get('/timemap/link/' + uri_r).data == body
+    assert len(rendered) == 1
+    assert handler.calls == [uri_r, uri_r]
+    assert app.cache.stats['stale_hits'] == 3
+
+    release.set()
+    for _ in range(100):
+        if not app.cache._revalidating:
+            break
+        time.sleep(0.01)
+    assert app.cache.peek(uri_r).timestamp > timestamp
+    assert app.cache.get_rendered(uri_r, 'link', base_url='http://localhost/',
+                                  stale=True) is None
+
+
+def test_rendered_version_key_dropped():
+    """Test bodies rendered from TimeMaps in memory are cached again."""
+    from timegate.application import TimeGate
+    from timegate.examples.simple import ExampleHandler
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    uri_r = 'http://www.example.com/resourceA'
+    app = TimeGate(config=dict(
+        HANDLER_MODULE=ExampleHandler(),
+        CACHE_BACKEND='werkzeug.contrib.cache.SimpleCache',
+    ))
+    client = Client(app, BaseResponse)
+    rendered = []
+    set_rendered = app.cache.set_rendered
+    app.cache.set_rendered = lambda *args, **kwargs: rendered.append(
+        set_rendered(*args, **kwargs))
+
+    body = client.get('/timemap/link/' + uri_r).data
+    # The backend drops the version key, the TimeMap stays in memory
+    app.cache.backend.delete('rendered|' + uri_r)
+    for _ in range(3):
+        assert client.get('/timemap/link/' + uri_r).data == body
+    assert len(rendered) == 2
+    assert app.cache.stats['misses'] == 1
+
+
+def test_get_mementos_between():
+    """Test expired TimeMaps and pages are fetched in part."""
+    from datetime import datetime, timedelta
+    from timegate.application import TimeGate
+    from timegate.examples.simple import ExampleHandler
+    from timegate.timemap import to_epoch
+    from timegate.utils import validate_date
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    uri_r = 'http://www.example.com/resourceA'
+
+    class IncrementalHandler(ExampleHandler):
+        calls = []
+
+        def get_all_mementos(self, uri_r):
+            self.calls.append(('all', ))
+            return ExampleHandler.get_all_mementos(self, uri_r)
+
+        def get_mementos_between(self, uri_r, start, end):
+            self.calls.append((to_epoch(start), to_epoch(end)))
+            return [(uri, dt) for uri, dt in
+                    ExampleHandler.get_all_mementos(self, uri_r)
+                    if start <= validate_date(dt) <= end]
+
+    handler = IncrementalHandler()
+    app = TimeGate(config=dict(
+        HANDLER_MODULE=handler,
+        CACHE_BACKEND='werkzeug.contrib.cache.SimpleCache',
+        CACHE_OPTIONS=dict(refresh_jitter=0),
+        TIMEMAP_PAGE_SIZE=1,
+    ))
+    client = Client(app, BaseResponse)
+
+    response = client.get('/timemap/link/20000101000000/20111231235959/' +
+                          uri_r)
+    assert response.status_code == 200
+    body = response.data.decode('utf-8')
+    assert '<{0}_v2>; rel=memento;'.format(uri_r) in body
+    assert 'rel=prev' not in body
+    assert 'rel=next' not in body
+    assert handler.calls == [(946684800, 1325375999)]
+    assert app.cache.get_all(uri_r) is None
+
+    del handler.calls[:]
+    assert client.get('/timemap/link/' + uri_r).status_code == 200
+    assert handler.calls == [('all', )]
+
+    # Cached TimeMaps are paged as before.
+    del handler.calls[:]
+    response = client.get('/timemap/link/20000101000000/20111231235959/' +
+                          uri_r)
+    assert 'rel=prev' in response.data.decode('utf-8')
+    assert handler.calls == []
+
+    # The mementos archived since the latest cached one are merged.
+    timestamp, timemap = app.cache.backend.get(uri_r)
+    handler.archives[uri_r].append(uri_r + '_v4')
+    handler.dates[uri_r].append('2016-02-29T12:00:00Z')
+    app.cache.backend.set(uri_r, (timestamp - timedelta(days=2), timemap))
+    app.cache.memory.clear()
+    response = client.get('/timemap/json/' + uri_r)
+    data = json.loads(response.data.decode('utf-8'))
+    assert [memento['uri'] for memento in data['mementos']['list']] == [
+        uri_r + '_v1', uri_r + '_v2', uri_r + '_v3', uri_r + '_v4',
+    ]
+    assert len(handler.calls) == 1
+    start, end = handler.calls[0]
+    assert start == 1420322400
+    assert end >= to_epoch(datetime.utcnow()) - 60
+    assert len(app.cache.get_all(uri_r)) == 4
+
+    # Clients asking for a fresh TimeMap get the whole history.
+    del handler.calls[:]
+    response = client.get('/timemap/link/' + uri_r,
+                          headers=[('Cache-Control', 'no-cache')])
+    assert response.status_code == 200
+    assert handler.calls == [('all', )]
+
+    # Merged TimeMaps are fetched whole after some merges or some time.
+    def expire():
+        timestamp, timemap = app.cache.backend.get(uri_r)
+        app.cache.backend.set(uri_r, (timestamp - timedelta(days=2),
+                                      timemap))
+        app.cache.backend.delete('rendered|' + uri_r)
+        app.cache.memory.clear()
+        del handler.calls[:]
+        assert client.get('/timemap/link/' + uri_r).status_code == 200
+        return handler.calls
+
+    app.cache.full_refresh_merges = 2
+    assert expire() != [('all', )]
+    assert expire() != [('all', )]
+    assert expire() == [('all', )]
+    assert expire() != [('all', )]
+    app.cache.full_refresh_merges = 0
+    fetched_at, merges = app.cache.backend.get('fetched|' + uri_r)
+    app.cache.backend.set('fetched|' + uri_r,
+                          (fetched_at - timedelta(days=7), merges))
+    assert expire() == [('all', )]
+    app.cache.full_refresh_time = timedelta(0)
+    assert expire() != [('all', )]
+
+
+def test_cache_entry_timeout(monkeypatch):
+    """Test expired TimeMaps are kept in the backend to be merged."""
+    import time
+    from timegate.cache import Cache
+    from timegate.timemap import Timemap
+
+    uri_r = 'http://www.example.com/resourceA'
+    cache = Cache('werkzeug.contrib.cache:SimpleCache',
+                  cache_refresh_time=86400, memory_threshold=0)
+    cache.set(uri_r, Timemap([uri_r + '_v1'], [0]), merged=False)
+
+    # Past the default timeout of the backend, 300 seconds
+    now = time.time()
+    monkeypatch.setattr('werkzeug.contrib.cache.time', lambda: now + 3600)
+    assert len(cache.peek(uri_r)) == 1
+    assert not cache.full_fetch_due(uri_r)
+    assert cache.backend.get('rendered|' + uri_r) is not None
+
+    monkeypatch.setattr('werkzeug.contrib.cache.time',
+                        lambda: now + 86400 + 604800 + 1)
+    assert cache.peek(uri_r) is None
+    assert cache.full_fetch_due(uri_r)
+
+    cache = Cache('werkzeug.contrib.cache:SimpleCache', full_refresh_time=0)
+    cache.set(uri_r, Timemap([uri_r + '_v1'], [0]))
+    assert cache.backend._cache[uri_r][0] == 0
+
+
+def test_not_found_cache():
+    """Test resources without mementos are cached."""
+    from timegate.application import TimeGate
+    from timegate.examples.simple import ExampleHandler
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    uri_r = 'http://www.example.com/resourceNew'
+
+    class CountingHandler(ExampleHandler):
+        calls = []
+
+        def get_all_mementos(self, uri_r):
+            self.calls.append(uri_r)
+            return ExampleHandler.get_all_mementos(self, uri_r)
+
+    handler = CountingHandler()
+    app = TimeGate(config=dict(
+        HANDLER_MODULE=handler,
+        CACHE_BACKEND='werkzeug.contrib.cache.SimpleCache',
+    ))
+    client = Client(app, BaseResponse)
+
+    for _ in range(3):
+        assert client.get('/timegate/' + uri_r).status_code == 404
+    assert client.get('/timemap/link/' + uri_r).status_code == 404
+    assert handler.calls == [uri_r]
+    assert app.cache.stats['not_found_stored'] == 1
+    assert app.cache.stats['not_found_hits'] == 3
+
+    handler.archives[uri_r] = [uri_r + '_v1']
+    handler.dates[uri_r] = ['2016-02-29T12:00:00Z']
+    for header in ('Cache-Control', 'Pragma'):
+        response = client.get('/timegate/' + uri_r,
+                              headers=[(header, 'no-cache')])
+        assert response.status_code == 302
+    assert handler.calls == [uri_r] * 3
+
+    # Storing the TimeMap forgets that it was not found.
+    assert client.get('/timegate/' + uri_r).status_code == 302
+    assert handler.calls == [uri_r] * 3
+    assert app.cache.get_not_found(uri_r) is None
+    assert app.cache.stats['hits'] == 1
+
+    app.cache.not_found_time = 0
+    del handler.archives[uri_r]
+    app.cache.backend.clear()
+    app.cache.memory.clear()
+    for _ in range(2):
+        assert client.get('/timegate/' + uri_r).status_code == 404
+    assert handler.calls == [uri_r] * 5
+
+
+def test_not_found_memento_cache(caplog):
+    """Test mementos not found by get_memento are cached."""
+    import logging
+    from datetime import datetime
+    from dateutil.tz import tzutc as UTC
+    from timegate.cache import NOT_FOUND_DAYS
+    from timegate.timemap import Timemap
+    from timegate.application import TimeGate
+    from timegate.examples.simple import ExampleHandler
+    from werkzeug.test import Client
+    from werkzeug.wrappers import BaseResponse
+
+    uri_r = 'http://www.example.com/resourceA'
+    unknown = 'http://www.example.com/resourceNew'
+
+    class CountingHandler(ExampleHandler):
+        calls = []
+
+        def get_memento(self, uri_r, req_datetime):
+            self.calls.append(uri_r)
+            if uri_r not in self.archives:
+                return []
+            return ExampleHandler.get_memento(self, uri_r, req_datetime)
+
+    handler = CountingHandler()
+    app = TimeGate(config=dict(
+        HANDLER_MODULE=handler,
+        CACHE_BACKEND='werkzeug.contrib.cache.SimpleCache',
+        USE_TIMEMAPS=False,
+    ))
+    client = Client(app, BaseResponse)
+    before_1999 = [('Accept-Datetime', 'Fri, 01 Jan 1990 00:00:00 GMT')]
+
+    # A URI-R without mementos is not found whatever the datetime.
+    for _ in range(2):
+        assert client.get('/timegate/' + unknown).status_code == 404
+        assert client.get('/timegate/' + unknown,
+                          headers=before_1999).status_code == 404
+    assert handler.calls == [unknown]
+
+    # Other datetimes are still asked for when one is not found.
+    del handler.calls[:]
+    for _ in range(2):
+        assert client.get('/timegate/' + uri_r,
+                          headers=before_1999).status_code == 404
+    assert client.get('/timegate/' + uri_r).status_code == 302
+    assert client.get('/timegate/' + uri_r, headers=before_1999 + [
+        ('Cache-Control', 'no-cache')]).status_code == 404
+    assert handler.calls == [uri_r] * 3
+    assert app.cache.stats['not_found_hits'] == 4
+
+    # The answers for many days take one bounded entry.
+    for day in range(1, 31):
+        assert client.get('/timegate/' + uri_r, headers=[(
+            'Accept-Datetime',
+            datetime(1990, 1, day, 12).strftime('%a, %d %b %Y %H:%M:%S GMT'),
+        )]).status_code == 404
+    assert [key for key in app.cache.backend._cache
+            if key.startswith('not_found|' + uri_r)] == ['not_found|' + uri_r]
+    assert len(app.cache.backend.get('not_found|' + uri_r)) == NOT_FOUND_DAYS
+    assert app.cache.get_not_found(uri_r, datetime(1990, 1, 30, tzinfo=UTC()))
+    assert not app.cache.get_not_found(uri_r, datetime(1990, 1, 2,
+                                                       tzinfo=UTC()))
+
+    # Storing the TimeMap forgets them.
+    app.cache.set(uri_r, Timemap([uri_r + '_v1'], [0]))
+    assert not app.cache.get_not_found(uri_r, datetime(1990, 1, 30,
+                                                       tzinfo=UTC()))
+
+    # The counters are logged periodically.
+    app.cache.stats_interval = 1
+    app.cache._stats_logged -= 1
+    with caplog.at_level(logging.INFO):
+        app.cache.get_not_found(unknown)
+    assert 'Cache statistics of process' in caplog.text
+    assert 'not_found_hits {0}'.format(
+        app.cache.stats['not_found_hits']) in caplog.text
+
+
+def test_baseline_cache_entries(app, client):
+    """Test TimeMaps cached as lists of tuples by former versions."""
+    from datetime import datetime
+    from dateutil.tz import tzutc
+
+    uri_r = 'http://www.example.com/resourceA'
+    now = datetime.utcnow().replace(tzinfo=tzutc())
+    app.cache.backend.set(uri_r, (now, [
+        (uri_r + '_v1', datetime(1999, 9, 30, 1, 50, 50, tzinfo=tzutc())),
+        (uri_r + '_v2', datetime(2010, 10, 16, 13, 27, 27, tzinfo=tzutc())),
+    ]))
+    response = client.get('/timegate/' + uri_r, headers=[
+        ('Accept-Datetime', 'Sat, 16 Oct 2010 13:27:27 GMT'),
+    ])
+    assert response.status_code == 302
+    assert response.headers['Location'] == uri_r + '_v2'
+    assert len(app.cache.get_all(uri_r)) == 2
+
+    # Entries that cannot be converted are deleted.
+    app.cache.backend.set(uri_r, (now, [(uri_r + '_v1', 'not a date')]))
+    assert app.cache.get_all(uri_r) is None
+    assert app.cache.backend.get(uri_r) is None
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib', 'lzma'])
+def test_codec(compression):
+    """Test the binary encoding of cached TimeMaps."""
+    from timegate import codec
+    from timegate.cache import Cache
+    from timegate.timemap import Timemap
+
+    uris = [u'http://www.example.com/{0}/résumé?v={1}'.format(
+        index // 300, index) for index in range(700)]
+    timemap = Timemap(uris, range(-350, 700 * 86400 - 350, 86400))
+    data = codec.encode(timemap, compression)
+    assert codec.is_encoded(data)
+
+    decoded = codec.decode(data)
+    assert decoded.digest == timemap.digest
+    assert len(decoded) == 700
+    assert decoded[0] == timemap[0]
+    assert decoded[-1] == timemap[-1]
+    assert decoded[300] == timemap[300]
+    assert decoded._uris is None
+    assert decoded == timemap
+    assert list(decoded) == list(timemap)
+
+    empty = codec.decode(codec.encode(Timemap(), compression))
+    assert len(empty) == 0 and empty.first is None
+
+    with pytest.raises(ValueError):
+        codec.decode(b'not a timemap')
+    with pytest.raises(ValueError):
+        codec.decode(data[:4] + b'\xff' + data[5:])
+    with pytest.raises(ValueError):
+        codec.encode(timemap, 'bz2')
+
+    # Cached TimeMaps are encoded, former entries are still read.
+    cache = Cache('werkzeug.contrib.cache:SimpleCache',
+                  timemap_compression=compression)
+    cache.set('a', timemap)
+    assert codec.is_encoded(cache.backend.get('a')[1])
+    assert cache.get_all('a') == timemap
+    cache.backend.set('b', (cache.get_all('a').timestamp, timemap))
+    assert cache.get_all('b') == timemap
+
+
+def test_sized_backends(tmpdir):
+    """Test cache backends bounded by the size of their values."""
+    import os
+    import time
+    from timegate.backends import SizedFileSystemCache, SizedSimpleCache
+    from timegate.cache import Cache
+    from timegate.timemap import Timemap
+
+    small = b'x' * 1000
+    large = b'x' * 30000
+
+    cache = SizedSimpleCache(threshold=100, max_size=50000)
+    for index in range(10):
+        assert cache.set('small{0}'.format(index), small)
+    assert cache.set('large', large)
+    assert cache.size <= 50000
+    assert not cache.set('huge', b'x' * 60000)
+    # The large value goes before the small ones.
+    assert cache.set('large2', large)
+    assert cache.get('large') is None
+    assert all(cache.get('small{0}'.format(index)) == small
+               for index in range(10))
+    assert cache.delete('large2')
+    assert cache.size == sum(len(data) for _, data in cache._cache.values())
+    assert not cache.add('small0', large)
+    cache.clear()
+    assert cache.size == 0
+
+    cache_dir = tmpdir.mkdir('cache').strpath
+    cache = SizedFileSystemCache(cache_dir, threshold=0, max_size=50000)
+    for index in range(10):
+        assert cache.set('small{0}'.format(index), small)
+    past = time.time() - 100
+    for path in cache._list_dir():
+        os.utime(path, (past, past))
+    assert cache.get('small0') == small
+    assert cache.set('large', large)
+    assert cache.set('large2', large)
+    assert cache.get('large') is None
+    assert sum(os.path.getsize(path) for path in cache._list_dir()) <= 45000
+    assert cache.get('small0') == small
+    assert not cache.set('huge', b'x' * 60000)
+    assert cache.get('huge') is None
+
+    # The maximum value size is checked against the encoded TimeMap.
+    cache = Cache('werkzeug.contrib.cache:SimpleCache', max_file_size=1000,
+                  timemap_compression='none')
+    cache.set('a', Timemap(['http://www.example.com/{0}'.format(index)
+                            for index in range(100)], range(100)))
+    assert cache.get_all('a') is None
+    cache.set('b', Timemap(['http://www.example.com/'], [0]))
+    assert len(cache.get_all('b')) == 1
+
+
+def test_mmap_backend(tmpdir):
+    """Test TimeMaps read through memory maps of sharded files."""
+    import os
+    import pickle
+    from datetime import datetime
+    from dateutil.tz import tzutc
+    from timegate.cache import Cache
+    from timegate.timemap import Timemap
+    from timegate.utils import best
+
+    cache_dir = tmpdir.mkdir('cache').strpath
+    cache = Cache('timegate.backends:MmapFileSystemCache', cache_dir=cache_dir,
+                  memory_threshold=0)
+    timemap = Timemap(['http://www.example.com/{0}'.format(index)
+                       for index in range(1000)], range(0, 100000, 100))
+    cache.set('http://www.example.com/', timemap)
+
+    path = cache.backend._get_filename('http://www.example.com/')
+    name = os.path.basename(path)
+    assert os.path.relpath(path, cache_dir) == os.path.join(
+        name[:2], name[2:4], name)
+    assert os.path.isfile(path)
+
+    timestamp, data = cache.backend.get('http://www.example.com/')
+    assert timestamp == timemap.timestamp
+    assert isinstance(data, (bytes, memoryview))
+
+    cached = cache.get_all('http://www.example.com/')
+    assert cached == timemap
+    assert cached.digest == timemap.digest
+    assert best(cached, datetime(1970, 1, 1, 0, 10, tzinfo=tzutc()),
+                'snapshot')[0][0] == 'http://www.example.com/6'
+    assert pickle.loads(pickle.dumps(cached)) == timemap
+
+    # Other values are pickled
+    cache.set_not_found('http://www.example.org/', 'Not found.')
+    assert cache.get_not_found('http://www.example.org/') == 'Not found.'
+    # The TimeMap, the version of its rendered bodies and the error
+    assert len(cache.backend._list_dir()) == 3
+    assert cache.backend.clear()
+    assert cache.backend._list_dir() == []
+    assert cache.get_all('http://www.example.com/') is None
+
+
+def test_warm(tmpdir, monkeypatch, capsys):
+    """Test the cache warm-up command."""
+    import io
+    from timegate import warm
+    from timegate.application import TimeGate
+    from timegate.examples.simple import ExampleHandler
+    from werkzeug.contrib.cache import NullCache
+
+    class CountingHandler(ExampleHandler):
+        calls = []
+
+        def get_all_mementos(self, uri_r):
+            self.calls.append(uri_r)
+            return ExampleHandler.get_all_mementos(self, uri_r)
+
+    handler = CountingHandler()
+    app = TimeGate(config=dict(
+        HANDLER_MODULE=handler,
+        CACHE_BACKEND='werkzeug.contrib.cache.SimpleCache',
+    ))
+    uris = list(warm.read_uris([io.StringIO(
+        u'http://www.example.com/resourceA\n\n# comment\n'
+        u'http://www.example.com/resourceB\n'
+        u'http://www.example.com/resourceA\n'
+        u'http://www.example.com/missing\n'
+    )]))
+    assert uris == ['http://www.example.com/resourceA',
+                    'http://www.example.com/resourceB',
+                    'http://www.example.com/resourceA',
+                    'http://www.example.com/missing']
+    del uris[2]
+
+    assert dict(warm.warm(app, uris, workers=2)) == {
+        'http://www.example.com/resourceA': 'cached',
+        'http://www.example.com/resourceB': 'cached',
+        'http://www.example.com/missing': 'not_found',
+    }
+    assert sorted(handler.calls) == sorted(uris)
+    assert len(app.cache.get_all('http://www.example.com/resourceA')) == 3
+
+    # Cached TimeMaps and missing resources are not fetched again.
+    del handler.calls[:]
+    assert [outcome for _, outcome in warm.warm(app, uris, workers=1)] == \
+        ['cached', 'cached', 'not_found']
+    assert handler.calls == []
+    list(warm.warm(app, uris[:1], refresh=True))
+    assert handler.calls == uris[:1]
+
+    # Long lists are read in batches.
+    del handler.calls[:]
+    outcomes = warm.warm(app, (uris[index % 2] for index in range(1000)),
+                         workers=2)
+    assert len(list(outcomes)) == 1000
+    assert handler.calls == []
+
+    uri_file = tmpdir.join('uris.txt')
+    uri_file.write('\n'.join(uris))
+    monkeypatch.setattr(warm, 'create_app', lambda config_path: app)
+    assert warm.main(['-j', '4', uri_file.strpath]) == 0
+    assert '3 URI-Rs in' in capsys.readouterr().err
+
+    # Nothing is fetched when the cache is disabled.
+    app.cache.backend = NullCache()
+    assert warm.main([uri_file.strpath]) == 1
+    assert 'URI-Rs in' not in capsys.readouterr().err
+
+
+def test_memory_cache():
+    """Test TimeMaps are kept in memory in front of the backend."""
+    from datetime import timedelta
+    from timegate.cache import Cache
+    from timegate.timemap import Timemap
+
+    uris = ['http://www.example.com/{0}'.format(index) for index in range(10)]
+    cache = Cache('werkzeug.contrib.cache:SimpleCache', refresh_jitter=0,
+                  cache_refresh_time=60, memory_threshold=2)
+    cache.set('a', Timemap(uris, range(10)))
+    reads = []
+    get = cache.backend.get
+    cache.backend.get = lambda key: reads.append(key) or get(key)
+
+    timemap = cache.get_all('a')
+    assert timemap.uris == uris
+    assert cache.get_all('a')._uris is None
+    assert reads == []
+    assert cache.stats['memory_hits'] == 2
+    # Blocks decoded in the copies are not kept in memory.
+    assert cache.get_all('a')[9][0] == uris[9]
+    assert cache.memory.get('a')[1]._coded_uris._last is None
+
+    # Expired TimeMaps are looked up in the backend.
+    later = timemap.timestamp + timedelta(seconds=61)
+    assert cache.get_until('a', later) is None
+    assert reads == ['a']
+
+    # The least recently used TimeMaps are evicted.
+    cache.set('b', Timemap(uris, range(10)))
+    cache.get_all('a')
+    cache.set('c', Timemap(uris, range(10)))
+    assert sorted(cache.memory._values) == ['a', 'c']
+    cache.get_all('b')
+    assert reads == ['a', 'b']
+    assert cache.memory.size == sum(
+        size for _, size in cache.memory._values.values())
+
+    cache.memory.max_size = 1
+    cache.set('d', Timemap(uris, range(10)))
+    assert 'd' not in cache.memory._values
+    assert Cache('werkzeug.contrib.cache:NullCache').memory is None
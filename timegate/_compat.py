@@ -14,11 +14,17 @@ import sys
 PY2 = sys.version_info[0] == 2
 
 if not PY2:  # pragma: no cover
+    from functools import lru_cache
     from urllib.parse import urlparse, quote, unquote
 
     text_type = str
     string_types = (str,)
     integer_types = (int,)
+
+    try:
+        import asyncio
+    except ImportError:
+        asyncio = None
 else:  # pragma: no cover
     from urlparse import urlparse
     from urllib2 import quote, unquote
@@ -26,3 +32,67 @@ else:  # pragma: no cover
     text_type = unicode
     string_types = (str, unicode)
     integer_types = (int, long)
+
+    from collections import namedtuple
+
+    CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+    def lru_cache(maxsize=128):
+        """Minimal replacement of :func:`functools.lru_cache`.
+
+        The cache is emptied once it holds ``maxsize`` results.
+        """
+        def decorator(function):
+            cache = {}
+            stats = [0, 0]
+
+            def wrapper(*args):
+                try:
+                    result = cache[args]
+                except KeyError:
+                    stats[1] += 1
+                    if len(cache) >= maxsize:
+                        cache.clear()
+                    result = cache[args] = function(*args)
+                    return result
+                stats[0] += 1
+                return result
+
+            def cache_info():
+                return CacheInfo(stats[0], stats[1], maxsize, len(cache))
+
+            def cache_clear():
+                cache.clear()
+                stats[:] = [0, 0]
+            wrapper.cache_info = cache_info
+            wrapper.cache_clear = cache_clear
+            return wrapper
+        return decorator
+
+    asyncio = None
+
+
+def iscoroutine(value):
+    """Return whether ``value`` is a coroutine object."""
+    return asyncio is not None and asyncio.iscoroutine(value)
+
+
+def iscoroutinefunction(function):
+    """Return whether ``function`` is a coroutine function."""
+    return asyncio is not None and asyncio.iscoroutinefunction(function)
+
+
+def run_coroutine(coroutine, loop=None):
+    """Run a coroutine to completion and return its result.
+
+    It runs on ``loop`` if that event loop is running in another thread,
+    on a new event loop otherwise.  It must not be called from a thread
+    that runs an event loop.
+    """
+    if loop is not None and loop.is_running():
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
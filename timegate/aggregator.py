@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of TimeGate.
+# Copyright (C) 2016 CERN.
+#
+# TimeGate is free software; you can redistribute it and/or modify
+# it under the terms of the Revised BSD License; see LICENSE file for
+# more details.
+
+"""Handler aggregating the TimeMaps of several archives."""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import threading
+import time
+
+from .constants import API_TIME_OUT
+from .errors import HandlerError
+from .handler import Handler, parsed_request
+from .timemap import Timemap
+
+
+class AggregatorHandler(Handler):
+    """Merge the TimeMaps returned by other handlers.
+
+    The handlers are called concurrently, each in its own thread.  Those
+    which fail or do not answer within their timeout are left out of the
+    TimeMap.  URI-Ms returned by several handlers are only listed once, at
+    their earliest datetime.
+    """
+
+    def __init__(self, handlers=(), timeout=None, timeouts=None):
+        """Build the aggregator.
+
+        :param handlers: Names, import paths or instances of the handlers
+            to aggregate.
+        :param timeout: (Optional) Number of seconds each handler has to
+            return its TimeMap. Defaults to ``API_TIME_OUT``.
+        :param timeouts: (Optional) Number of seconds given to some of the
+            handlers instead of ``timeout``, by the name or instance they
+            are listed with in ``handlers``.
+        """
+        from .application import load_handler
+
+        Handler.__init__(self)
+        self.timeout = API_TIME_OUT if timeout is None else timeout
+        timeouts = timeouts or {}
+        self.handlers, self.timeouts = [], []
+        for name in handlers:
+            handler = load_handler(name)
+            if hasattr(handler, 'get_all_mementos'):
+                self.handlers.append(handler)
+                self.timeouts.append(timeouts.get(name, self.timeout))
+        if not self.handlers:
+            raise ValueError('The aggregator has no handler with a '
+                             '`get_all_mementos` method.')
+
+    def get_all_mementos(self, uri_r):
+        """Return the merged TimeMaps of all handlers.
+
+        :param uri_r: The URI-R of the original resource.
+        :return: A sorted :class:`~timegate.timemap.Timemap`.
+        :raises HandlerError: If no handler answered.
+        """
+        results = [None] * len(self.handlers)
+
+        def fetch(index, handler):
+            try:
+                results[index] = parsed_request(handler.get_all_mementos,
+                                                uri_r)
+            except HandlerError as e:
+                results[index] = e
+
+        threads = []
+        for index, handler in enumerate(self.handlers):
+            # Threads of handlers that time out must not block the exit
+            thread = threading.Thread(target=fetch, args=(index, handler))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        start = time.time()
+        for thread, timeout in zip(threads, self.timeouts):
+            thread.join(max(start + timeout - time.time(), 0))
+
+        timemaps = []
+        failures = 0
+        for handler, result in zip(self.handlers, results):
+            name = handler.__class__.__name__
+            if result is None:
+                logging.warning('%s timed out for %s' % (name, uri_r))
+                failures += 1
+            elif isinstance(result, HandlerError):
+                if result.code != 404:
+                    logging.warning('%s failed for %s: %s' % (
+                        name, uri_r, result.description))
+                    failures += 1
+            else:
+                timemaps.append(result)
+
+        if failures == len(self.handlers):
+            raise HandlerError('No archive could be reached.', 503)
+
+        return Timemap.merge(*timemaps)
@@ -19,26 +19,33 @@ import json
 import logging
 import os
 import re
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from json.encoder import encode_basestring_ascii
+from multiprocessing.pool import ThreadPool
 
 from dateutil.tz import tzutc
-from link_header import Link, LinkHeader
+from link_header import Link
 from pkg_resources import iter_entry_points
 from werkzeug.datastructures import CombinedMultiDict
 from werkzeug.exceptions import HTTPException, abort
-from werkzeug.http import http_date, parse_date
-from werkzeug.local import Local, LocalManager
+from werkzeug.http import generate_etag, is_resource_modified, quote_etag
+from werkzeug.local import Local, LocalManager, release_local
 from werkzeug.routing import BaseConverter, Map, Rule, ValidationError
 from werkzeug.utils import cached_property, import_string
 from werkzeug.wrappers import Request, Response
 
 from . import constants
-from ._compat import quote, unquote
+from ._compat import (iscoroutinefunction, lru_cache, quote, run_coroutine,
+                      unquote)
 from .cache import Cache
 from .config import Config
-from .errors import TimegateError, URIRequestError
+from .errors import HandlerError, TimegateError, URIRequestError
 from .handler import Handler, parsed_request
-from .utils import best
+from .timemap import Timemap, from_epoch
+from .utils import (CONTENT_ENCODINGS, best, compress, http_date,
+                    iter_compressed, paginate, parse_http_date)
 
 local = Local()
 """Thread safe local data storage."""
@@ -51,14 +58,26 @@ request = local('request')
 
 _RE_HANDLER = re.compile('^((?P<handler_name>[^.]+)\.)?(?P<endpoint>[^.]+)$')
 
+DEFAULT_CONFIG_PATH = os.path.join(
+    os.path.dirname(__file__), 'conf', 'config.ini'
+)
+"""Path to the configuration file used by the WSGI application."""
+
+_app = None
+_app_lock = threading.Lock()
+
 
 def url_for(*args, **kwargs):
     """Proxy to URL Map adapter builder."""
     return request.adapter.build(*args, **kwargs)
 
 
-def load_handler(name_or_path):
-    """Load handler from entry points or import string."""
+def load_handler(name_or_path, **options):
+    """Load handler from entry points or import string.
+
+    :param name_or_path: Entry point name, import string or instance.
+    :param options: Keyword arguments of the handler constructor.
+    """
     if isinstance(name_or_path, Handler):
         return name_or_path
 
@@ -71,9 +90,9 @@ def load_handler(name_or_path):
             )
         )
     elif number_of_handlers == 1:
-        return handlers[0].load()()
+        return handlers[0].load()(**options)
     else:
-        return import_string(name_or_path)()
+        return import_string(name_or_path)(**options)
 
 
 class URIConverter(BaseConverter):
@@ -106,6 +125,26 @@ class URIConverter(BaseConverter):
         return value
 
 
+class DatetimeConverter(BaseConverter):
+    """Datetime converter for ``YYYYMMDDhhmmss`` UTC timestamps."""
+
+    regex = r'\d{14}'
+    weight = 50
+
+    def to_python(self, value):
+        """Return a timezone aware datetime."""
+        try:
+            return datetime.strptime(value, '%Y%m%d%H%M%S').replace(
+                tzinfo=tzutc()
+            )
+        except ValueError:
+            raise ValidationError()
+
+    def to_url(self, value):
+        """Return the timestamp of a datetime."""
+        return value.strftime('%Y%m%d%H%M%S')
+
+
 class TimeGate(object):
     """Implementation of Memento protocol with configurable handlers."""
 
@@ -134,7 +173,13 @@ class TimeGate(object):
         self.register_handler(None, CombinedMultiDict([
             self.config.get('HANDLERS', {}).get(None, {}), self.config
         ]))
-        return Map(self.rules, converters={'uri': URIConverter})
+        self.rules.append(
+            Rule('/timegate/batch', endpoint='batch', methods=['POST'])
+        )
+        return Map(self.rules, converters={
+            'uri': URIConverter,
+            'datetime': DatetimeConverter,
+        })
 
     def _build_default_cache(self):
         """Build default cache object."""
@@ -155,7 +200,8 @@ class TimeGate(object):
 
     def register_handler(self, handler_name, config):
         """Register handler."""
-        handler = load_handler(config['HANDLER_MODULE'])
+        handler = load_handler(config['HANDLER_MODULE'],
+                               **config.get('HANDLER_OPTIONS', {}))
         HAS_TIMEGATE = hasattr(handler, 'get_memento')
         HAS_TIMEMAP = hasattr(handler, 'get_all_mementos')
         if config['USE_TIMEMAPS'] and (not HAS_TIMEMAP):
@@ -172,6 +218,9 @@ class TimeGate(object):
             hasattr(handler, 'get_all_mementos') and config['USE_TIMEMAPS']
         )
         handler.resource_type = config['RESOURCE_TYPE']
+        handler.resource_links = lru_cache(
+            maxsize=config['LINK_CACHE_SIZE']
+        )(_build_resource_links)
 
         endpoint_prefix = '{0}.'.format(handler_name) if handler_name else ''
         uri_r = '<uri(base_uri="{0}", default={1}):uri_r>'.format(
@@ -182,7 +231,12 @@ class TimeGate(object):
             Rule('/timegate/{0}'.format(uri_r),
                  endpoint=endpoint_prefix + 'timegate',
                  methods=['GET', 'HEAD']),
-            Rule('/timemap/<any(json, link):response_type>/{0}'.format(uri_r),
+            Rule('/timemap/<any(json, cjson, link):response_type>/{0}'.format(
+                uri_r),
+                 endpoint=endpoint_prefix + 'timemap',
+                 methods=['GET', 'HEAD']),
+            Rule('/timemap/<any(json, cjson, link):response_type>/'
+                 '<datetime:from_dt>/<datetime:until_dt>/{0}'.format(uri_r),
                  endpoint=endpoint_prefix + 'timemap',
                  methods=['GET', 'HEAD']),
         ])
@@ -207,41 +261,121 @@ class TimeGate(object):
     def wsgi_app(self, environ, start_response):
         local.request = request = Request(environ)
         response = self.dispatch_request(request)
+        if not self.config['KEEP_ALIVE']:
+            if isinstance(response, HTTPException):
+                response = response.get_response(environ)
+            response.headers['Connection'] = 'close'
         return response(environ, start_response)
 
     def __call__(self, environ, start_response):
         """Handle a request."""
         return self.wsgi_app(environ, start_response)
 
-    def get_memento(self, uri_r, accept_datetime):
+    def get_memento(self, uri_r, accept_datetime, handler=None):
         """Return a URL-M for an original resource.
 
         It must span at least up to a certain date.
 
         :param uri_r: The original resource to look for.
         :param accept_datetime: Datetime object with requested time.
+        :param handler: (Optional) The handler to use instead of the one
+            of the current request.
         :return: The TimeMap if it exists and is valid.
         """
-        return parsed_request(request.handler.get_memento,
-                              uri_r, accept_datetime)
+        handler = handler or request.handler
+        # Finding no memento for now, as requests without Accept-Datetime
+        # ask, means the handler has none at all
+        now = datetime.utcnow().replace(tzinfo=tzutc())
+        date = accept_datetime \
+            if accept_datetime < now - timedelta(seconds=1) else None
+        if self.cache and _allows_cache(request):
+            description = self.cache.get_not_found(uri_r, date)
+            if description is not None:
+                raise HandlerError(description, 404)
+        try:
+            return parsed_request(
+                _handler_method(handler, 'get_memento', uri_r),
+                uri_r, accept_datetime,
+            )
+        except HandlerError as e:
+            if e.code == 404:
+                self.cache.set_not_found(uri_r, e.description, date)
+            raise
 
-    def get_all_mementos(self, uri_r):
+    def get_all_mementos(self, uri_r, handler=None):
         """Uses the handler to retrieve a TimeMap for an original resource.
 
-        The value is cached if the cache is activated.
+        The value is cached if the cache is activated.  When the cached
+        TimeMap expired and the handler has a ``get_mementos_between``
+        method, only the mementos archived since its latest one are
+        fetched and merged into it, unless a whole fetch is due, see
+        :meth:`~timegate.cache.Cache.full_fetch_due`.
 
         :param uri_r: The URI to retrieve and cache the TimeMap of.
+        :param handler: (Optional) The handler to use instead of the one
+            of the current request.
         :return: The retrieved value.
         """
+        handler = handler or request.handler
+        use_cache = _allows_cache(request)
+        method = _handler_method(handler, 'get_all_mementos', uri_r)
+        mergeable = hasattr(handler, 'get_mementos_between')
+        incremental = use_cache and mergeable
+
+        def fetch():
+            cached = self.cache.peek(uri_r) if incremental and \
+                not self.cache.full_fetch_due(uri_r) else None
+            if cached:
+                mementos = self.get_mementos_between(
+                    uri_r, from_epoch(cached.epochs[-1]),
+                    datetime.utcnow().replace(tzinfo=tzutc()), handler=handler
+                )
+                mementos = Timemap.merge(cached, mementos)
+            else:
+                try:
+                    mementos = parsed_request(method, uri_r)
+                except HandlerError as e:
+                    if e.code == 404:
+                        self.cache.set_not_found(uri_r, e.description)
+                    raise
+            self.cache.set(uri_r, mementos,
+                           merged=bool(cached) if mergeable else None)
+            return mementos
+
         mementos = None
-        if self.cache and request.cache_control != 'no-cache':
-            mementos = self.cache.get_all(uri_r)
+        if self.cache and use_cache:
+            mementos = self.cache.get_all(uri_r, refresh=fetch)
+            if mementos is None:
+                description = self.cache.get_not_found(uri_r)
+                if description is not None:
+                    raise HandlerError(description, 404)
         if mementos is None:
-            mementos = parsed_request(request.handler.get_all_mementos, uri_r)
-            if self.cache:
-                self.cache.set(uri_r, mementos)
+            mementos = self.cache.single_flight(uri_r, fetch,
+                                                recheck=use_cache)
         return mementos
 
+    def get_mementos_between(self, uri_r, start, end, handler=None):
+        """Use the handler to retrieve the mementos within two datetimes.
+
+        :param uri_r: The URI-R of the original resource.
+        :param start: Datetime of the oldest memento to return.
+        :param end: Datetime of the latest memento to return.
+        :param handler: (Optional) The handler to use instead of the one
+            of the current request.
+        :return: A sorted :class:`~timegate.timemap.Timemap`, empty if no
+            memento was archived between both datetimes.
+        """
+        handler = handler or request.handler
+        try:
+            return parsed_request(
+                _handler_method(handler, 'get_mementos_between', uri_r),
+                uri_r, start, end,
+            )
+        except HandlerError as e:
+            if e.code != 404:
+                raise
+            return Timemap()
+
     def timegate(self, uri_r):
         """Handle timegate high-level logic.
 
@@ -252,65 +386,298 @@ class TimeGate(object):
         :return: The body of the HTTP response.
         """
         if 'Accept-Datetime' in request.headers:
-            accept_datetime = parse_date(
-                request.headers['Accept-Datetime']
-            ).replace(tzinfo=tzutc())
+            accept_datetime = parse_http_date(
+                request.headers['Accept-Datetime'],
+                strict=self.config['STRICT_TIME'],
+            )
         else:
             accept_datetime = datetime.utcnow().replace(tzinfo=tzutc())
 
         # Runs the handler's API request for the Memento
-        mementos = first = last = None
+        mementos = first = last = prev_memento = next_memento = None
         if request.handler.use_timemaps:
             logging.debug('Using multiple-request mode.')
             mementos = self.get_all_mementos(uri_r)
 
+        validators = []
         if mementos:
             first = mementos[0]
             last = mementos[-1]
-            memento = best(mementos, accept_datetime,
-                           request.handler.resource_type)
+            memento, prev_memento, next_memento = best(
+                mementos, accept_datetime, request.handler.resource_type
+            )
+            digest = generate_etag('{0} {1} {2}'.format(
+                mementos.digest, memento[0], memento[1].isoformat()
+            ).encode('utf-8'))
+            validators = _validators(digest, mementos.timestamp)
+            if not _is_modified(digest, mementos.timestamp):
+                return not_modified_response(
+                    [('Vary', 'accept-datetime')] + validators
+                )
         else:
             logging.debug('Using single-request mode.')
-            memento = self.get_memento(uri_r, accept_datetime)
+            # If the handler returned several Mementos, take the closest
+            memento = best(
+                self.get_memento(uri_r, accept_datetime), accept_datetime,
+                request.handler.resource_type
+            )[0]
 
-        # If the handler returned several Mementos, take the closest
-        return memento_response(
+        response = memento_response(
             memento,
             uri_r,
             first,
             last,
             has_timemap=request.handler.use_timemaps,
+            prev_memento=prev_memento,
+            next_memento=next_memento,
         )
+        response.headers.extend(validators)
+        return response
+
+    def batch(self):
+        """Handle batch TimeGate requests.
+
+        The body is a JSON array, or newline delimited JSON when the
+        content type is ``application/x-ndjson``, of ``{"uri_r": ...,
+        "accept_datetime": ...}`` objects or ``[uri_r, accept_datetime]``
+        pairs.  The datetime is optional and defaults to now.
+
+        Pairs are grouped by URI-R so that each TimeMap is loaded once, and
+        up to ``BATCH_WORKERS`` distinct URI-Rs are resolved concurrently.
+        Results are returned in the order of the request, in the same
+        format, and carry either the best, first and last mementos or the
+        status and description of the error.
+
+        :return: The body of the HTTP response.
+        """
+        ndjson = request.mimetype == 'application/x-ndjson'
+        items = _parse_batch(request.get_data(as_text=True), ndjson)
+        if len(items) > self.config['BATCH_MAX_SIZE']:
+            raise TimegateError(
+                'Batch requests are limited to {0} items.'.format(
+                    self.config['BATCH_MAX_SIZE']), 413
+            )
+
+        now = datetime.utcnow().replace(tzinfo=tzutc())
+        results = [None] * len(items)
+        groups = OrderedDict()
+        for index, (uri_r, value) in enumerate(items):
+            try:
+                accept_datetime = parse_http_date(
+                    value, strict=self.config['STRICT_TIME']
+                ) if value is not None else now
+                endpoint, values = request.adapter.match(
+                    '/timegate/' + uri_r, method='GET'
+                )
+            except HTTPException as e:
+                results[index] = _batch_error(uri_r, e)
+                continue
+            handler = self.handlers[
+                _RE_HANDLER.match(endpoint).group('handler_name')
+            ]
+            groups.setdefault(values['uri_r'], (handler, []))[1].append(
+                (index, accept_datetime)
+            )
+
+        def resolve(uri_r):
+            handler, pairs = groups[uri_r]
+            try:
+                if handler.use_timemaps:
+                    mementos = self.get_all_mementos(uri_r, handler=handler)
+                    return [(index, _batch_result(
+                        uri_r, best(mementos, accept_datetime,
+                                    handler.resource_type)[0],
+                        mementos[0], mementos[-1],
+                    )) for index, accept_datetime in pairs]
+                return [(index, _batch_result(uri_r, best(
+                    self.get_memento(uri_r, accept_datetime, handler=handler),
+                    accept_datetime, handler.resource_type,
+                )[0])) for index, accept_datetime in pairs]
+            except HTTPException as e:
+                return [(index, _batch_error(uri_r, e)) for index, _ in pairs]
+
+        current_request = local.request
+
+        def resolve_in_thread(uri_r):
+            local.request = current_request
+            try:
+                return resolve(uri_r)
+            finally:
+                release_local(local)
+
+        workers = min(self.config['BATCH_WORKERS'], len(groups))
+        if workers > 1:
+            pool = ThreadPool(workers)
+            try:
+                resolved = pool.map(resolve_in_thread, groups, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            resolved = [resolve(uri_r) for uri_r in groups]
+        for group in resolved:
+            for index, result in group:
+                results[index] = result
 
-    def timemap(self, uri_r, response_type='link'):
+        if ndjson:
+            body = ''.join(json.dumps(result) + '\n' for result in results)
+        else:
+            body = json.dumps(results)
+        return Response(body, headers=[
+            ('Date', http_date(datetime.utcnow())),
+            ('Content-Type',
+             'application/x-ndjson' if ndjson else 'application/json'),
+        ])
+
+    def timemap(self, uri_r, response_type='link', from_dt=None,
+                until_dt=None):
         """Handle TimeMap high-level logic.
 
         It fetches all Mementos for an Original Resource and builds the TimeMap
         response. Returns a HTTP 200 response if it exists with the timemap in
         the message body.
 
-        :param req_uri: The requested original resource URI.
-        :param start_response: WSGI callback function.
+        When ``from_dt`` and ``until_dt`` are given, only a page of at most
+        ``TIMEMAP_PAGE_SIZE`` mementos within these bounds is returned,
+        with links to the previous and next pages.  If the TimeMap is not
+        cached and the handler has a ``get_mementos_between`` method, only
+        the mementos within the bounds are fetched, and the page has no
+        link to a previous page.
+
+        :param uri_r: The requested original resource URI.
+        :param response_type: Format of the TimeMap.
+        :param from_dt: (Optional) Datetime of the first memento of a page.
+        :param until_dt: (Optional) Datetime of the last memento of a page.
         :return: The body of the HTTP response.
         """
         if not request.handler.use_timemaps:
             abort(403)
+        encoding = request.accept_encodings.best_match(CONTENT_ENCODINGS)
+
+        # Only whole TimeMaps are pre-rendered
+        use_rendered = (from_dt is None and self.cache.cache_rendered and
+                        _allows_cache(request))
+        base_url = _base_url()
+        mementos = None
+        if use_rendered:
+            cached = self.cache.get_rendered(uri_r, response_type, encoding,
+                                             base_url=base_url, stale=True)
+            if cached is not None and self.cache.expired(uri_r, cached[0]):
+                # Served stale while the TimeMap is revalidated, unless it
+                # was replaced or dropped in the meantime
+                mementos = self.get_all_mementos(uri_r)
+                if mementos.timestamp != cached[0]:
+                    cached = None
+            if cached is not None:
+                timestamp, digest, body = cached
+                digest = _encoded_digest(digest, encoding)
+                validators = _validators(digest, timestamp)
+                if not _is_modified(digest, timestamp):
+                    return not_modified_response(
+                        [('Vary', 'accept-encoding')] + validators
+                    )
+                return Response(body, headers=(
+                    _timemap_headers(response_type, encoding) + validators
+                ))
+
+        partial = False
+        if from_dt is not None and \
+                hasattr(request.handler, 'get_mementos_between'):
+            if _allows_cache(request):
+                mementos = self.cache.get_all(uri_r)
+            if mementos is None:
+                mementos = self.get_mementos_between(uri_r, from_dt, until_dt)
+                partial = True
+        if mementos is None:
+            mementos = self.get_all_mementos(uri_r)
+        digest = _encoded_digest(mementos.digest, encoding)
+        validators = _validators(digest, mementos.timestamp)
+        if not _is_modified(digest, mementos.timestamp):
+            return not_modified_response(
+                [('Vary', 'accept-encoding')] + validators
+            )
+
+        timemap = mementos
+        pages = None
+        # The first and last mementos of a page fetched in part are unknown
+        ends = (None, None) if partial else _ends(timemap)
+        if from_dt is not None:
+            mementos, prev_bounds, next_bounds = paginate(
+                mementos, from_dt, until_dt, self.config['TIMEMAP_PAGE_SIZE']
+            )
+            if not mementos:
+                raise TimegateError('No Memento in the requested range.', 404)
+            pages = OrderedDict([('self', (from_dt, until_dt))])
+            if prev_bounds:
+                pages['prev'] = prev_bounds
+            if next_bounds:
+                pages['next'] = next_bounds
 
-        mementos = self.get_all_mementos(uri_r)
         # Generates the TimeMap response body and Headers
-        if response_type == 'json':
-            return timemap_json_response(self, mementos, uri_r)
+        if response_type in ('json', 'cjson'):
+            response = timemap_json_response(
+                self, mementos, uri_r, compact=response_type == 'cjson',
+                pages=pages, ends=ends,
+            )
         else:
-            return timemap_link_response(self, mementos, uri_r)
+            response = timemap_link_response(self, mementos, uri_r,
+                                             pages=pages, ends=ends)
+        response.headers.extend(validators)
+
+        if use_rendered:
+            body = response.get_data()
+            self.cache.set_rendered(uri_r, response_type, body, timemap,
+                                    base_url=base_url)
+            if encoding:
+                body = compress(body, encoding)
+                self.cache.set_rendered(uri_r, response_type, body, timemap,
+                                        encoding=encoding, base_url=base_url)
+                response.set_data(body)
+        elif encoding:
+            response.response = iter_compressed(response.response, encoding)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def create_app(config_path=None):
+    """Create a TimeGate application configured from an INI file.
+
+    The configuration is loaded before the application is built so that
+    the cache backend defined in the file is the one being used.  The URL
+    map, and therefore all handlers, are built eagerly.
+
+    :param config_path: Path to the INI file. Defaults to
+        :data:`DEFAULT_CONFIG_PATH`.
+    :return: The :class:`TimeGate` instance.
+    """
+    config = Config(None)
+    config.from_inifile(config_path or DEFAULT_CONFIG_PATH)
+    app = TimeGate(config=config)
+    app.url_map  # register handlers once, at creation time
+    return app
+
+
+def get_app():
+    """Return the process wide application, building it on first use.
+
+    The instance is shared by all threads of a worker process.
+    """
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
 
 
 @local_manager.middleware
 def application(environ, start_response):
     """WSGI application object.
 
-    This is the start point of the TimeGate server.
-
-    TimeMap requests are parsed here.
+    This is the start point of the TimeGate server.  The configured
+    application is created by the first request of each worker process
+    and reused by all the following ones.
 
     :param environ: Dictionary containing environment variables from
     the client request.
@@ -318,11 +685,207 @@ def application(environ, start_response):
     and headers to the server.
     :return: The response body, in a list of one str element.
     """
-    app = TimeGate()
-    app.config.from_inifile(
-        os.path.join(os.path.dirname(__file__), 'conf', 'config.ini')
+    return get_app()(environ, start_response)
+
+
+def _handler_method(handler, name, uri_r):
+    """Return the handler method to call for an original resource.
+
+    The ASGI application awaits ``async def`` handler methods on its event
+    loop before dispatching the request and stores replacements returning
+    their results under the ``timegate.awaited`` environ key.  Each of
+    them is used once.  Other ``async def`` methods the request calls are
+    run on the loop stored under the ``timegate.loop`` key while the
+    calling thread waits.
+
+    :param handler: The handler of the original resource.
+    :param name: The name of the method.
+    :param uri_r: The URI-R of the original resource.
+    """
+    # Background revalidations run outside of any request
+    req = getattr(local, 'request', None)
+    environ = req.environ if req is not None else {}
+    awaited = environ.get('timegate.awaited')
+    if awaited and (name, uri_r) in awaited:
+        return awaited.pop((name, uri_r))
+    method = getattr(handler, name)
+    loop = environ.get('timegate.loop')
+    if loop is None or not iscoroutinefunction(method):
+        return method
+
+    def run_on_loop(*args):
+        return run_coroutine(method(*args), loop)
+    return run_on_loop
+
+
+def _allows_cache(req):
+    """Return whether a request may be answered from the cache.
+
+    :param req: The request, which must not have a ``Cache-Control`` or
+        ``Pragma`` header with the ``no-cache`` directive.
+    """
+    return not req.cache_control.no_cache and 'no-cache' not in req.pragma
+
+
+def not_modified_response(headers):
+    """Return a 304 response to a conditional request.
+
+    :param headers: The validators and other headers of the response.
+    :return: The ``Response`` object.
+    """
+    return Response(None, headers=[
+        ('Date', http_date(datetime.utcnow())),
+    ] + headers, status=304)
+
+
+def _encoded_digest(digest, encoding):
+    """Return the entity tag of a TimeMap body in a content coding."""
+    if digest and encoding:
+        return '{0}-{1}'.format(digest, encoding)
+    return digest
+
+
+def _validators(digest, timestamp):
+    """Return the ETag and Last-Modified headers of a cached TimeMap.
+
+    :param digest: The TimeMap digest used as entity tag.
+    :param timestamp: The datetime at which the TimeMap was cached.
+    """
+    headers = []
+    if digest:
+        headers.append(('ETag', quote_etag(digest)))
+    if timestamp is not None:
+        headers.append(('Last-Modified', http_date(timestamp)))
+    return headers
+
+
+def _is_modified(digest, timestamp):
+    """Evaluate the conditional headers of the current request."""
+    if timestamp is not None:
+        timestamp = timestamp.astimezone(tzutc()).replace(tzinfo=None)
+    return is_resource_modified(request.environ, etag=digest,
+                                last_modified=timestamp)
+
+
+def _parse_batch(data, ndjson=False):
+    """Parse the body of a batch request.
+
+    :param data: The JSON or newline delimited JSON text.
+    :param ndjson: Whether the text is newline delimited JSON.
+    :return: A list of ``(uri_r, accept_datetime)`` tuples where the
+        datetime is the unparsed header value or ``None``.
+    :raises TimegateError: If the body is not a valid batch request.
+    """
+    try:
+        if ndjson:
+            items = [json.loads(line) for line in data.splitlines()
+                     if line.strip()]
+        else:
+            items = json.loads(data)
+        if not isinstance(items, list):
+            raise ValueError()
+        pairs = []
+        for item in items:
+            if isinstance(item, dict):
+                item = (item['uri_r'], item.get('accept_datetime'))
+            elif not isinstance(item, list) or not 1 <= len(item) <= 2:
+                raise ValueError()
+            uri_r = item[0]
+            value = item[1] if len(item) > 1 else None
+            if not isinstance(uri_r, type(u'')) or not (
+                    value is None or isinstance(value, type(u''))):
+                raise ValueError()
+            pairs.append((uri_r, value))
+        return pairs
+    except (KeyError, ValueError):
+        raise TimegateError(
+            'Invalid batch request, expected a list of '
+            '{"uri_r": ..., "accept_datetime": ...} objects.'
+        )
+
+
+def _batch_result(uri_r, memento, first=None, last=None):
+    """Return the result of a batch item resolved to a memento."""
+    result = OrderedDict([('uri_r', uri_r), ('memento', _memento_dict(
+        memento))])
+    if first:
+        result['first'] = _memento_dict(first)
+        result['last'] = _memento_dict(last)
+    return result
+
+
+def _batch_error(uri_r, error):
+    """Return the result of a batch item that could not be resolved."""
+    return OrderedDict([
+        ('uri_r', uri_r),
+        ('status', error.code),
+        ('error', error.description),
+    ])
+
+
+def _memento_dict(memento):
+    """Return the JSON TimeMap representation of a memento."""
+    return OrderedDict([('uri', memento[0]),
+                        ('datetime', http_date(memento[1]))])
+
+
+def _resource_links(uri_r):
+    """Return the rendered links of an original resource.
+
+    They only depend on the URI-R and on the host the request was sent to,
+    so they are memoized by the handler of the request.
+
+    :param uri_r: The URI-R of the original resource.
+    :return: A dictionary of link strings and URLs, see
+        :func:`_build_resource_links`.
+    """
+    adapter = request.adapter
+    return request.handler.resource_links(
+        uri_r, adapter.url_scheme, adapter.server_name, adapter.script_name
+    )
+
+
+def _base_url():
+    """Return the base URL the links of the current request are built for.
+
+    Bodies holding absolute links are cached per base URL.
+    """
+    adapter = request.adapter
+    return '{0}://{1}{2}'.format(adapter.url_scheme, adapter.server_name,
+                                 adapter.script_name)
+
+
+def _build_resource_links(uri_r, url_scheme, server_name, script_name):
+    """Render the links of an original resource.
+
+    The scheme, server and script names identify the URL adapter of the
+    current request, which is used to build the URLs.
+
+    :return: A dictionary holding the ``original``, ``timegate``,
+        ``link_self`` and ``timemaps`` link strings, the latter being the
+        link-format and JSON TimeMap links, and the ``timegate_uri``,
+        ``link_uri``, ``json_uri`` and ``cjson_uri`` URLs.
+    """
+    timegate_uri = url_for('timegate', dict(uri_r=uri_r),
+                           force_external=True)
+    link_uri = _timemap_url(uri_r, 'link')
+    json_uri = _timemap_url(uri_r, 'json')
+    cjson_uri = _timemap_url(uri_r, 'cjson')
+    return dict(
+        original=str(Link(uri_r, rel='original')),
+        timegate=str(Link(timegate_uri, rel='timegate')),
+        link_self=str(Link(link_uri, rel='self',
+                           type='application/link-format')),
+        timemaps=[
+            str(Link(link_uri, rel='timemap',
+                     type='application/link-format')),
+            str(Link(json_uri, rel='timemap', type='application/json')),
+        ],
+        timegate_uri=timegate_uri,
+        link_uri=link_uri,
+        json_uri=json_uri,
+        cjson_uri=cjson_uri,
     )
-    return app(environ, start_response)
 
 
 def memento_response(
@@ -330,7 +893,9 @@ def memento_response(
         uri_r,
         first=None,
         last=None,
-        has_timemap=False):
+        has_timemap=False,
+        prev_memento=None,
+        next_memento=None):
     """Return a 302 redirection to the best Memento for a resource.
 
     It includes necessary headers including datetime requested by the user.
@@ -341,43 +906,36 @@ def memento_response(
     :param last: (Optional) (URI string, dt obj) of the last memento.
     :param has_timemap: Flag indicating that the handler accepts
         TimeMap requests too. Default True.
+    :param prev_memento: (Optional) (URI string, dt obj) of the memento
+        preceding the best one.
+    :param next_memento: (Optional) (URI string, dt obj) of the memento
+        following the best one.
     :return: The ``Response`` object.
     """
     # Gather links containing original and if availible: TimeMap, first, last
     # TimeGate link not allowed here
-    links = [Link(uri_r, rel='original')]
+    resource_links = _resource_links(uri_r)
+    links = [resource_links['original']]
     if has_timemap:
-        for response_type, mime in (('link', 'application/link-format'),
-                                    ('json', 'application/json'), ):
-            links.append(Link(
-                url_for('timemap', dict(
-                    response_type=response_type, uri_r=uri_r
-                ), force_external=True),
-                rel='timemap', type=mime
-            ))
-
-    (uri_m, dt_m) = memento
-    (uri_last, dt_last) = (uri_first, dt_first) = (None, None)
-    if last:
-        (uri_last, dt_last) = last
-    if first:
-        (uri_first, dt_first) = first
-    if first and last and uri_first == uri_last:
-        # There's only one memento (first = best = last)
-        assert(uri_last == uri_m)
-        links.append(Link(uri_m, rel='first last memento',
-                          datetime=http_date(dt_m)))
-    else:
-        if first:
-            links.append(Link(uri_m, rel='first memento',
-                              datetime=http_date(dt_first)))
-        if (uri_first != uri_m and uri_last != uri_m):
-            # The best memento is neither the first nor the last
-            links.append(Link(uri_m, rel='memento',
-                              datetime=http_date(dt_m)))
-        if last:
-            links.append(Link(uri_m, rel='last memento',
-                              datetime=http_date(dt_last)))
+        links.extend(resource_links['timemaps'])
+
+    # Merge the relations of mementos appearing several times, e.g. when
+    # there is only one memento (first = best = last).
+    relations = OrderedDict()
+    for rel, value in (('first', first),
+                       ('prev', prev_memento),
+                       (None, memento),
+                       ('next', next_memento),
+                       ('last', last)):
+        if value:
+            rels = relations.setdefault(tuple(value), [])
+            if rel:
+                rels.append(rel)
+    for (uri, dt), rels in relations.items():
+        links.append(str(Link(uri, rel=' '.join(rels + ['memento']),
+                              datetime=http_date(dt))))
+
+    uri_m = memento[0]
 
     # Builds the response headers
     headers = [
@@ -385,126 +943,253 @@ def memento_response(
         ('Vary', 'accept-datetime'),
         ('Content-Length', '0'),
         ('Content-Type', 'text/plain; charset=UTF-8'),
-        ('Connection', 'close'),
         ('Location', uri_m),
-        ('Link', str(LinkHeader(links))),
+        ('Link', ', '.join(links)),
     ]
     return Response(None, headers=headers, status=302)
 
 
-def timemap_link_response(app, mementos, uri_r):
+def timemap_link_response(app, mementos, uri_r, pages=None, ends=None):
     """Return a 200 TimeMap response.
 
-    :param mementos: A sorted (ascending by date) list of (uri_str,
-    datetime_obj) tuples representing a TimeMap.
+    The body is streamed in chunks of ``TIMEMAP_CHUNK_SIZE`` characters
+    using chunked transfer encoding, thus without ``Content-Length``.
+
+    :param mementos: A sorted :class:`~timegate.timemap.Timemap`.
     :param uri_r: The URI-R of the original resource.
+    :param pages: (Optional) Mapping of ``self``, ``prev`` and ``next``
+        to the ``(from, until)`` bounds of the TimeMap pages.
+    :param ends: (Optional) The first and last mementos of the whole
+        TimeMap as ``(uri, epoch)`` tuples, ``None`` when they are
+        unknown.  Defaults to those of ``mementos``.
     :return: The ``Response`` object.
     """
     assert len(mementos) >= 1
+    pages = pages or {}
 
     # Adds Original, TimeGate and TimeMap links
-    original_link = Link(uri_r, rel='original')
-    timegate_link = Link(
-        url_for('timegate', dict(uri_r=uri_r), force_external=True),
-        rel='timegate',
-    )
-    link_self = Link(
-        url_for('timemap', dict(
-            response_type='link', uri_r=uri_r
-        ), force_external=True),
-        rel='self', type='application/link-format',
-    )
-    json_self = Link(
-        url_for('timemap', dict(
-            response_type='json', uri_r=uri_r
-        ), force_external=True),
-        rel='timemap', type='application/json',
+    resource_links = _resource_links(uri_r)
+    links = [resource_links['original'], resource_links['timegate']]
+    if pages:
+        links.extend([
+            str(Link(_timemap_url(uri_r, 'link', pages['self']), [
+                ('rel', 'self'), ('type', 'application/link-format'),
+                ('from', http_date(mementos.epochs[0])),
+                ('until', http_date(mementos.epochs[-1])),
+            ])),
+            str(Link(_timemap_url(uri_r, 'json', pages['self']),
+                     rel='timemap', type='application/json')),
+        ])
+    else:
+        links.extend([resource_links['link_self'],
+                      resource_links['timemaps'][1]])
+    for rel in ('prev', 'next'):
+        if rel in pages:
+            links.append(str(Link(_timemap_url(uri_r, 'link', pages[rel]), [
+                ('rel', rel), ('type', 'application/link-format'),
+                ('from', http_date(pages[rel][0])),
+                ('until', http_date(pages[rel][1])),
+            ])))
+
+    body = _iter_chunks(
+        _iter_link_timemap(links, mementos, ends or _ends(mementos)),
+        app.config['TIMEMAP_CHUNK_SIZE'],
     )
 
-    # Sets up first and last relations
-    if len(mementos) == 1:
-        mementos_links = [Link(mementos[0][0], rel='first last memento',
-                               datetime=http_date(mementos[0][1]))]
-    else:
-        # Browse through Mementos to generate the TimeMap links list
-        mementos_links = [
-            Link(mementos[0][0], rel='first memento',
-                 datetime=http_date(mementos[0][1]))
-        ] + [
-            Link(uri, rel='memento', datetime=http_date(date))
-            for (uri, date) in mementos[1:-1]
-        ] + [
-            Link(mementos[-1][0], rel='last memento',
-                 datetime=http_date(mementos[-1][1]))
-        ]
-
-    # Aggregates all link strings and constructs the TimeMap body
-    links = [original_link, timegate_link, link_self, json_self]
-    links.extend(mementos_links)
-    body = ',\n'.join([str(l) for l in links]) + '\n'
-
-    # Builds HTTP Response and WSGI return
+    return Response(body, headers=_timemap_headers('link'))
+
+
+def _timemap_headers(response_type, encoding=None):
+    """Return the HTTP headers of a 200 TimeMap response.
+
+    :param response_type: Format of the TimeMap.
+    :param encoding: (Optional) The content coding of the body.
+    """
     headers = [
         ('Date', http_date(datetime.utcnow())),
-        ('Content-Length', str(len(body))),
-        ('Content-Type', 'application/link-format'),
-        ('Connection', 'close'),
+        ('Content-Type', 'application/link-format'
+         if response_type == 'link' else 'application/json'),
+        ('Vary', 'accept-encoding'),
     ]
-    return Response(body, headers=headers)
+    if encoding:
+        headers.append(('Content-Encoding', encoding))
+    return headers
+
+
+def _timemap_url(uri_r, response_type, bounds=None):
+    """Build the external URL of a TimeMap or of one of its pages.
+
+    :param uri_r: The URI-R of the original resource.
+    :param response_type: Format of the TimeMap.
+    :param bounds: (Optional) ``(from, until)`` datetimes of a page.
+    """
+    values = dict(response_type=response_type, uri_r=uri_r)
+    if bounds:
+        values.update(from_dt=bounds[0], until_dt=bounds[1])
+    return url_for('timemap', values, force_external=True)
+
+
+def _iter_link_timemap(links, mementos, ends):
+    """Generate the pieces of a link-format TimeMap body.
 
+    Memento links are formatted straight from the TimeMap arrays.  Only
+    the first and last mementos of the whole TimeMap get the ``first``
+    and ``last`` relations, not those of a page.
 
-def timemap_json_response(app, mementos, uri_r):
+    :param links: Already formatted links preceding the mementos.
+    :param mementos: A sorted :class:`~timegate.timemap.Timemap`.
+    :param ends: The first and last mementos of the whole TimeMap as
+        ``(uri, epoch)`` tuples, ``None`` when they are unknown.
+    """
+    first, last = ends
+    end = len(mementos) - 1
+    yield ',\n'.join(links)
+    for index, (uri, epoch) in enumerate(zip(mementos.uris,
+                                             mementos.epochs)):
+        if index == 0 or index == end:
+            rels = [rel for rel, memento in (('first', first),
+                                             ('last', last))
+                    if memento == (uri, epoch)]
+            rel = '"{0} memento"'.format(' '.join(rels)) if rels \
+                else 'memento'
+        else:
+            rel = 'memento'
+        yield ',\n<{0}>; rel={1}; datetime="{2}"'.format(
+            uri, rel, http_date(epoch)
+        )
+    yield '\n'
+
+
+def _ends(timemap):
+    """Return the first and last mementos as ``(uri, epoch)`` tuples."""
+    if not timemap:
+        return None, None
+    return ((timemap[0][0], timemap.epochs[0]),
+            (timemap[-1][0], timemap.epochs[-1]))
+
+
+def _iter_chunks(pieces, chunk_size):
+    """Group strings into chunks of at least ``chunk_size`` characters.
+
+    Only one chunk is held in memory at a time, whatever the number of
+    pieces.
+    """
+    chunk = []
+    size = 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def timemap_json_response(app, mementos, uri_r, compact=False, pages=None,
+                          ends=None):
     """Creates and sends a timemap response.
 
-    :param mementos: A sorted list of (uri_str, datetime_obj) tuples
-    representing a timemap.
+    The ``mementos.list`` array is encoded incrementally and the body is
+    streamed in chunks like :func:`timemap_link_response`.  The compact
+    variant encodes each memento as an ``[uri, epoch seconds]`` pair and
+    uses no whitespace.
+
+    :param mementos: A sorted :class:`~timegate.timemap.Timemap`.
     :param uri_r: The URI-R of the original resource.
-    :param start_response: WSGI callback function.
+    :param compact: Use the compact memento encoding.
+    :param pages: (Optional) Mapping of ``self``, ``prev`` and ``next``
+        to the ``(from, until)`` bounds of the TimeMap pages.
+    :param ends: (Optional) The first and last mementos of the whole
+        TimeMap, see :func:`timemap_link_response`.
     :return: The ``Response`` object.
     """
     assert len(mementos) >= 1
+    pages = pages or {}
+    response_type = 'cjson' if compact else 'json'
 
-    # Prepares the JSON response by building a dict
-    response_dict = {}
+    resource_links = _resource_links(uri_r)
+    timegate_uri = resource_links['timegate_uri']
 
-    response_dict['original_uri'] = uri_r
-    response_dict['timegate_uri'] = url_for(
-        'timegate', dict(uri_r=uri_r), force_external=True
+    # Builds self (TimeMap)links dict
+    if pages:
+        timemap_uri = OrderedDict([
+            ('json_format', _timemap_url(uri_r, 'json', pages['self'])),
+            ('link_format', _timemap_url(uri_r, 'link', pages['self'])),
+            ('cjson_format', _timemap_url(uri_r, 'cjson', pages['self'])),
+        ])
+    else:
+        timemap_uri = OrderedDict([
+            ('json_format', resource_links['json_uri']),
+            ('link_format', resource_links['link_uri']),
+            ('cjson_format', resource_links['cjson_uri']),
+        ])
+    pages_uri = OrderedDict(
+        (rel, _timemap_url(uri_r, response_type, pages[rel]))
+        for rel in ('prev', 'next') if rel in pages
+    ) if pages else None
+
+    body = _iter_chunks(
+        _iter_json_timemap(uri_r, timegate_uri, timemap_uri, mementos,
+                           ends or _ends(mementos), compact=compact,
+                           pages=pages_uri),
+        app.config['TIMEMAP_CHUNK_SIZE'],
     )
 
-    # Browse through Mementos to generate TimeMap links dict list
-    mementos_links = [
-        {'uri': urlstr, 'datetime': http_date(date)}
-        for (urlstr, date) in mementos
-    ]
+    return Response(body, headers=_timemap_headers(response_type))
 
-    # Builds up first and last links dict
-    firstlink = {'uri': mementos[0][0], 'datetime': http_date(mementos[0][1])}
-    lastlink = {'uri': mementos[-1][0], 'datetime': http_date(mementos[-1][1])}
 
-    response_dict['mementos'] = {
-        'last': lastlink,
-        'first': firstlink,
-        'list': mementos_links,
-    }
+def _iter_json_timemap(uri_r, timegate_uri, timemap_uri, mementos, ends,
+                       compact=False, pages=None):
+    """Generate the pieces of a JSON TimeMap body.
 
-    # Builds self (TimeMap)links dict
-    response_dict['timemap_uri'] = {
-        'json_format': url_for('timemap', dict(
-            response_type='json', uri_r=uri_r
-        ), force_external=True),
-        'link_format': url_for('timemap', dict(
-            response_type='link', uri_r=uri_r
-        ), force_external=True),
-    }
-
-    # Creates the JSON str from the dict
-    response_json = json.dumps(response_dict)
-
-    # Builds HTTP Response and WSGI return
-    headers = [
-        ('Date', http_date(datetime.utcnow())),
-        ('Content-Length', str(len(response_json))),
-        ('Content-Type', 'application/json'),
-    ]
-    return Response(response_json, headers=headers)
+    The output is the same as ``json.dumps`` of the equivalent document.
+    The ``first`` and ``last`` mementos are left out when unknown.
+
+    :param uri_r: The URI-R of the original resource.
+    :param timegate_uri: The URI of the TimeGate.
+    :param timemap_uri: Mapping of TimeMap formats to their URIs.
+    :param mementos: A sorted :class:`~timegate.timemap.Timemap`.
+    :param ends: The first and last mementos of the whole TimeMap as
+        ``(uri, epoch)`` tuples, ``None`` when they are unknown.
+    :param compact: Encode mementos as ``[uri, epoch]`` pairs.
+    :param pages: (Optional) Mapping of ``prev`` and ``next`` to the URIs
+        of the neighbouring pages.
+    """
+    encode = encode_basestring_ascii
+    if compact:
+        separators = (',', ':')
+        memento_format = '[{0},{1}]'
+
+        def format_memento(uri, epoch):
+            return memento_format.format(encode(uri), epoch)
+    else:
+        separators = (', ', ': ')
+        memento_format = '{{"uri": {0}, "datetime": "{1}"}}'
+
+        def format_memento(uri, epoch):
+            return memento_format.format(encode(uri), http_date(epoch))
+
+    item, key = separators
+    first, last = ends
+    yield '{{"original_uri"{1}{2}{0}"timegate_uri"{1}{3}{0}' \
+        '"mementos"{1}{{'.format(item, key, encode(uri_r),
+                                 encode(timegate_uri))
+    for name, memento in (('last', last), ('first', first)):
+        if memento is not None:
+            yield '"{0}"{1}{2}{3}'.format(
+                name, key, format_memento(*memento), item
+            )
+    yield '"list"{0}['.format(key)
+    yield format_memento(mementos.uris[0], mementos.epochs[0])
+    for uri, epoch in zip(mementos.uris[1:], mementos.epochs[1:]):
+        yield item + format_memento(uri, epoch)
+    yield ']}}{0}"timemap_uri"{1}{2}'.format(
+        item, key, json.dumps(timemap_uri, separators=separators)
+    )
+    if pages is not None:
+        yield '{0}"pages"{1}{2}'.format(
+            item, key, json.dumps(pages, separators=separators)
+        )
+    yield '}'
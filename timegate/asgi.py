@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of TimeGate.
+# Copyright (C) 2016 CERN.
+#
+# TimeGate is free software; you can redistribute it and/or modify
+# it under the terms of the Revised BSD License; see LICENSE file for
+# more details.
+
+"""ASGI entry point of the TimeGate server.
+
+It requires Python 3.5 or newer and is left out of the installations on
+older versions.  Requests are routed, cached and
+rendered by the same :class:`~timegate.application.TimeGate` object as
+the WSGI application, on a pool of threads.  The ``async def`` handler
+method a request needs is awaited on the event loop before, once for
+concurrent requests, unless the request is answered from the cache, so
+slow archives do not hold the threads.
+"""
+
+from __future__ import absolute_import, print_function
+
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from dateutil.tz import tzutc
+from werkzeug.exceptions import HTTPException
+from werkzeug.local import release_local
+from werkzeug.wrappers import Request
+
+from ._compat import iscoroutinefunction
+from .application import _RE_HANDLER, _allows_cache, get_app, local
+from .errors import DateTimeError
+from .timemap import from_epoch
+from .utils import parse_http_date
+
+# Only available from Python 3.7, get_event_loop is deprecated in coroutines
+_get_running_loop = getattr(asyncio, 'get_running_loop',
+                            asyncio.get_event_loop)
+
+
+class ASGIApplication(object):
+    """ASGI application serving a :class:`~timegate.application.TimeGate`."""
+
+    def __init__(self, app=None, max_workers=None):
+        """Build the ASGI application.
+
+        :param app: (Optional) The TimeGate application. Defaults to the
+            process wide one returned by
+            :func:`~timegate.application.get_app`.
+        :param max_workers: (Optional) Number of threads running the
+            synchronous code.
+        """
+        self._app = app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._flights = {}
+
+    async def get_app(self):
+        """Return the TimeGate application, building it on first use."""
+        if self._app is None:
+            loop = _get_running_loop()
+            self._app = await loop.run_in_executor(self.executor, get_app)
+        return self._app
+
+    async def __call__(self, scope, receive, send):
+        """Handle an ASGI connection."""
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(
+                'Unsupported ASGI scope type "{0}".'.format(scope['type'])
+            )
+
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+
+        app = await self.get_app()
+        environ = build_environ(scope, b''.join(body))
+        loop = _get_running_loop()
+        environ['timegate.loop'] = loop
+        await self.await_handler(app, environ)
+        await loop.run_in_executor(
+            self.executor, self.respond, app, environ, send, loop
+        )
+
+    async def await_handler(self, app, environ):
+        """Await the ``async def`` handler method a request will call.
+
+        The cache is looked up first, from a thread, the same way as the
+        request will be, and nothing is awaited if it answers the request.
+        The result, or the exception, of the method is stored under the
+        ``timegate.awaited`` environ key, where
+        :func:`~timegate.application._handler_method` finds it.
+
+        :param app: The TimeGate application.
+        :param environ: The WSGI environ of the request.
+        """
+        try:
+            endpoint, values = app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return
+        parts = _RE_HANDLER.match(endpoint).groupdict()
+        handler = app.handlers[parts['handler_name']]
+        uri_r = values['uri_r']
+        use_cache = app.cache and _allows_cache(Request(environ))
+        loop = _get_running_loop()
+
+        def run(function, *args):
+            return loop.run_in_executor(self.executor, function, *args)
+
+        now = datetime.utcnow().replace(tzinfo=tzutc())
+        if parts['endpoint'] == 'timegate' and not handler.use_timemaps:
+            try:
+                accept_datetime = parse_http_date(
+                    environ['HTTP_ACCEPT_DATETIME'],
+                    strict=app.config['STRICT_TIME'],
+                ) if 'HTTP_ACCEPT_DATETIME' in environ else now
+            except DateTimeError:
+                return
+            date = accept_datetime \
+                if accept_datetime < now - timedelta(seconds=1) else None
+            if use_cache and await run(app.cache._not_found, uri_r, date):
+                return
+            name, args = 'get_memento', (uri_r, accept_datetime)
+        elif parts['endpoint'] in ('timegate', 'timemap') and \
+                handler.use_timemaps:
+            cached = await run(app.cache.peek, uri_r) if use_cache else None
+            mergeable = hasattr(handler, 'get_mementos_between')
+            if values.get('from_dt') is not None and mergeable:
+                # Pages use fresh cached TimeMaps only
+                if cached is not None and \
+                        not app.cache.expired(uri_r, cached.timestamp):
+                    return
+                name = 'get_mementos_between'
+                args = (uri_r, values['from_dt'], values['until_dt'])
+            elif cached is not None and not app.cache.expired(
+                    uri_r, cached.timestamp, stale=True):
+                # Stale TimeMaps are revalidated in the background
+                return
+            elif use_cache and await run(app.cache._not_found, uri_r):
+                return
+            elif cached is not None and mergeable and \
+                    not await run(app.cache.full_fetch_due, uri_r):
+                name = 'get_mementos_between'
+                args = (uri_r, from_epoch(cached.epochs[-1]), now)
+            else:
+                name, args = 'get_all_mementos', (uri_r, )
+        else:
+            return
+
+        method = getattr(handler, name)
+        if not iscoroutinefunction(method):
+            return
+        try:
+            result = await self.await_once(loop, (name, ) + args, method,
+                                           args)
+        except Exception as e:
+            error = e
+
+            def awaited(*args):
+                raise error
+        else:
+            def awaited(*args):
+                return result
+        environ['timegate.awaited'] = {(name, uri_r): awaited}
+
+    async def await_once(self, loop, key, method, args):
+        """Await a coroutine function once for concurrent callers.
+
+        :param loop: The running event loop.
+        :param key: The hashable key of the call.
+        :param method: The coroutine function.
+        :param args: The arguments of the call.
+        :return: The result of the call.
+        """
+        key = (id(loop), ) + key
+        future = self._flights.get(key)
+        if future is None:
+            future = self._flights[key] = asyncio.ensure_future(
+                method(*args))
+            future.add_done_callback(lambda _: self._flights.pop(key, None))
+        # A cancelled request does not cancel the call of the others
+        return await asyncio.shield(future)
+
+    async def lifespan(self, receive, send):
+        """Build the application on startup and stop the threads on exit."""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.get_app()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def respond(self, app, environ, send, loop):
+        """Dispatch a request and send the response, from a thread."""
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            send_message({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'),
+                             value.encode('latin-1'))
+                            for name, value in headers],
+            })
+
+        try:
+            iterable = app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        send_message({'type': 'http.response.body',
+                                      'body': chunk, 'more_body': True})
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+            send_message({'type': 'http.response.body'})
+        finally:
+            release_local(local)
+
+
+def build_environ(scope, body):
+    """Build the WSGI environ of an ASGI HTTP request.
+
+    :param scope: The ASGI connection scope.
+    :param body: The request body as bytes.
+    :return: The environ dictionary.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode(
+            'latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/{0}'.format(
+            scope.get('http_version', '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+
+application = ASGIApplication()
+"""ASGI application object, see :data:`timegate.application.application`."""
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of TimeGate.
+# Copyright (C) 2016 CERN.
+#
+# TimeGate is free software; you can redistribute it and/or modify
+# it under the terms of the Revised BSD License; see LICENSE file for
+# more details.
+
+"""Cache backends bounded by the size of what they store.
+
+The werkzeug backends bound the number of entries, whatever their size,
+so a single huge TimeMap weighs as much as a small one.  These backends
+also keep the total size of the entries under ``max_size`` bytes.  When
+it is exceeded, the entries that are both large and unused for long go
+first: they are evicted by decreasing product of their size and the time
+since they were last used.
+
+:class:`MmapFileSystemCache` also stores the encoded TimeMaps as they are
+and reads them through memory maps, so that finding a memento only reads
+the pages of the epochs it bisects and of the URI-Ms it returns.
+"""
+
+from __future__ import absolute_import, print_function
+
+import errno
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from werkzeug._compat import text_type
+from werkzeug.contrib.cache import FileSystemCache, SimpleCache, md5
+from werkzeug.posixemulation import rename
+
+from . import codec
+from .timemap import EPOCH
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+
+def eviction_order(entries, now):
+    """Sort entries in the order in which they are evicted.
+
+    :param entries: Iterable of ``(key, size, last_used)`` tuples.
+    :param now: The current time in seconds.
+    :return: The sorted list of entries.
+    """
+    return sorted(entries, key=lambda entry: entry[1] * (now - entry[2] + 1),
+                  reverse=True)
+
+
+class SizedSimpleCache(SimpleCache):
+    """Memory cache bounded by the size of its pickled values.
+
+    :param threshold: The maximum number of entries.
+    :param default_timeout: The default timeout of the entries.
+    :param max_size: The maximum total size of the entries in bytes. 0
+        means no limit.
+    """
+
+    def __init__(self, threshold=500, default_timeout=300, max_size=0):
+        """Build the cache."""
+        SimpleCache.__init__(self, threshold, default_timeout)
+        self.max_size = max_size
+        self.size = 0
+        self._used = {}
+        self._lock = threading.RLock()
+        # SimpleCache binds clear to the dictionary, hiding the method
+        del self.clear
+
+    def get(self, key):
+        """Return a value and mark it as used."""
+        value = SimpleCache.get(self, key)
+        if value is not None and key in self._cache:
+            self._used[key] = time.time()
+        return value
+
+    def set(self, key, value, timeout=None):
+        """Store a value, evicting others if needed."""
+        return self._store(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        """Store a value if the key is not used yet."""
+        return self._store(key, value, timeout, replace=False)
+
+    def delete(self, key):
+        """Remove a value."""
+        with self._lock:
+            item = self._cache.pop(key, None)
+            self._used.pop(key, None)
+            if item is None:
+                return False
+            self.size -= len(item[1])
+            return True
+
+    def clear(self):
+        """Remove all the values."""
+        with self._lock:
+            self._cache.clear()
+            self._used.clear()
+            self.size = 0
+        return True
+
+    def _store(self, key, value, timeout, replace=True):
+        """Store a pickled value under the lock."""
+        expires = self._normalize_timeout(timeout)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if self.max_size and len(data) > self.max_size:
+            return False
+        with self._lock:
+            if key in self._cache:
+                if not replace:
+                    return False
+                self.delete(key)
+            self._prune(len(data))
+            self._cache[key] = (expires, data)
+            self._used[key] = time.time()
+            self.size += len(data)
+        return True
+
+    def _prune(self, incoming=0):
+        """Evict entries to make room for ``incoming`` bytes."""
+        now = time.time()
+        for key, (expires, _) in list(self._cache.items()):
+            if expires != 0 and expires <= now:
+                self.delete(key)
+        over_threshold = len(self._cache) - self._threshold + 1
+        over_size = self.size + incoming - self.max_size \
+            if self.max_size else 0
+        if over_threshold <= 0 and over_size <= 0:
+            return
+        entries = eviction_order(
+            ((key, len(data), self._used.get(key, 0))
+             for key, (_, data) in self._cache.items()), now
+        )
+        for key, size, _ in entries:
+            if over_threshold <= 0 and over_size <= 0:
+                break
+            self.delete(key)
+            over_threshold -= 1
+            over_size -= size
+
+
+class SizedFileSystemCache(FileSystemCache):
+    """File system cache bounded by the size of its files.
+
+    The size of the directory is measured when it may exceed ``max_size``
+    given what this process wrote since, and at least every
+    ``scan_interval`` seconds to account for other processes.  It is
+    then brought back under 90% of ``max_size``.  Reading an entry
+    updates the modification time of its file.
+
+    :param cache_dir: The directory of the cache files.
+    :param threshold: The maximum number of files, 0 means no limit.
+    :param default_timeout: The default timeout of the entries.
+    :param mode: The mode of the cache files.
+    :param max_size: The maximum total size of the files in bytes. 0
+        means no limit.
+    :param scan_interval: The maximum number of seconds between two
+        measures of the directory size.
+    """
+
+    def __init__(self, cache_dir, threshold=500, default_timeout=300,
+                 mode=0o600, max_size=0, scan_interval=60):
+        """Build the cache."""
+        # Set first, the parent constructor reads and writes the count file
+        self.max_size = max_size
+        self.scan_interval = scan_interval
+        self._lock = threading.Lock()
+        self._size = self._scanned = 0
+        FileSystemCache.__init__(self, cache_dir, threshold, default_timeout,
+                                 mode)
+        if max_size:
+            self._prune_size()
+
+    def get(self, key):
+        """Return a value and mark its file as used."""
+        value = FileSystemCache.get(self, key)
+        if value is not None and self.max_size:
+            try:
+                os.utime(self._get_filename(key), None)
+            except OSError:
+                pass
+        return value
+
+    def set(self, key, value, timeout=None, mgmt_element=False):
+        """Store a value, evicting others if needed."""
+        result = FileSystemCache.set(self, key, value, timeout=timeout,
+                                     mgmt_element=mgmt_element)
+        if not result or mgmt_element:
+            return result
+        return self._account(key)
+
+    def _account(self, key):
+        """Add the size of a new file, evicting others if needed."""
+        if not self.max_size:
+            return True
+        try:
+            size = os.path.getsize(self._get_filename(key))
+        except OSError:
+            return True
+        if size > self.max_size:
+            self.delete(key)
+            return False
+        with self._lock:
+            self._size += size
+            scan = (self._size > self.max_size or
+                    time.time() - self._scanned > self.scan_interval)
+        if scan:
+            self._prune_size()
+        return True
+
+    def _prune_size(self):
+        """Measure the files and evict some if they exceed ``max_size``."""
+        now = time.time()
+        entries = []
+        for path in self._list_dir():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        size = sum(entry[1] for entry in entries)
+        if size > self.max_size:
+            target = self.max_size * 0.9
+            for path, file_size, _ in eviction_order(entries, now):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                size -= file_size
+                if size <= target:
+                    break
+            self._update_count(value=len(self._list_dir()))
+        with self._lock:
+            self._size = size
+            self._scanned = now
+
+
+class MmapFileSystemCache(SizedFileSystemCache):
+    """File system cache reading the TimeMaps through memory maps.
+
+    Values that are ``(timestamp, encoded TimeMap)`` tuples, as stored by
+    :class:`~timegate.cache.Cache`, are written after the expiry of the
+    file without being pickled.  Reading one maps the file and returns
+    the encoded TimeMap as a :class:`memoryview` of the map, which
+    :func:`~timegate.codec.decode` reads in place: the epoch column is
+    bisected where it lies and a URI block is only read when one of its
+    URI-Ms is used.  Other values are pickled as by ``FileSystemCache``.
+
+    Files are spread over two levels of subdirectories named after the
+    first characters of their hash, to keep directories small.  The
+    parameters are those of :class:`SizedFileSystemCache`.
+    """
+
+    _RECORD = struct.Struct('<4sqB')  # magic, timestamp, padding
+    _MAGIC = b'TGMM'
+
+    def _get_filename(self, key):
+        """Return the sharded path of the file of a key."""
+        if isinstance(key, text_type):
+            key = key.encode('utf-8')
+        digest = md5(key).hexdigest()
+        return os.path.join(self._path, digest[:2], digest[2:4], digest)
+
+    def _list_dir(self):
+        """Return the paths of the cache files of all the subdirectories."""
+        mgmt_files = [os.path.basename(self._get_filename(name))
+                      for name in (self._fs_count_file, )]
+        return [
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(self._path)
+            for name in names
+            if not name.endswith(self._fs_transaction_suffix) and
+            name not in mgmt_files
+        ]
+
+    def get(self, key):
+        """Return a value, mapping the file of an encoded TimeMap."""
+        filename = self._get_filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                expires = pickle.load(f)
+                if expires != 0 and expires < time.time():
+                    os.remove(filename)
+                    return None
+                start = f.tell()
+                record = f.read(self._RECORD.size)
+                if record[:len(self._MAGIC)] != self._MAGIC:
+                    f.seek(start)
+                    value = pickle.load(f)
+                else:
+                    _, timestamp, padding = self._RECORD.unpack(record)
+                    start += self._RECORD.size + padding
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    value = (
+                        EPOCH + timedelta(microseconds=timestamp),
+                        memoryview(mapped)[start:]
+                        if hasattr(memoryview, 'cast') else mapped[start:],
+                    )
+        except (IOError, OSError, EOFError, ValueError, pickle.PickleError):
+            return None
+        if self.max_size:
+            try:
+                os.utime(filename, None)
+            except OSError:
+                pass
+        return value
+
+    def set(self, key, value, timeout=None, mgmt_element=False):
+        """Store a value in its subdirectory, evicting others if needed."""
+        if mgmt_element:
+            timeout = 0
+        else:
+            self._prune()
+        timeout = self._normalize_timeout(timeout)
+        filename = self._get_filename(key)
+        try:
+            _makedirs(os.path.dirname(filename))
+            fd, tmp = tempfile.mkstemp(suffix=self._fs_transaction_suffix,
+                                       dir=os.path.dirname(filename))
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(timeout, f, 1)
+                if self._is_timemap(value):
+                    self._write_timemap(f, *value)
+                else:
+                    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            rename(tmp, filename)
+            os.chmod(filename, self._mode)
+        except (IOError, OSError):
+            return False
+        if mgmt_element:
+            return True
+        self._update_count(delta=1)
+        return self._account(key)
+
+    @staticmethod
+    def _is_timemap(value):
+        """Return whether a value is a timestamped encoded TimeMap."""
+        return isinstance(value, tuple) and len(value) == 2 and \
+            hasattr(value[0], 'utcoffset') and codec.is_encoded(value[1])
+
+    def _write_timemap(self, f, timestamp, data):
+        """Write a timestamped encoded TimeMap without pickling it.
+
+        Padding aligns its epoch column on 8 bytes in the file, and thus
+        in the page-aligned maps of the file.
+        """
+        delta = timestamp - EPOCH
+        start = f.tell() + self._RECORD.size
+        padding = -(start + codec._HEADER.size) % 8
+        f.write(self._RECORD.pack(
+            self._MAGIC,
+            (delta.days * 86400 + delta.seconds) * 10 ** 6 +
+            delta.microseconds,
+            padding,
+        ))
+        f.write(b'\0' * padding)
+        f.write(data)
+
+
+def _makedirs(path):
+    """Create a directory and its parents unless it exists."""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
@@ -12,89 +12,715 @@
 
 from __future__ import absolute_import, print_function
 
+import errno
+import gzip
 import logging
 import os
-import sys
-from datetime import datetime
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from io import BytesIO
 
 from dateutil.relativedelta import relativedelta
 from dateutil.tz import tzutc
-from werkzeug.contrib.cache import FileSystemCache, md5
+from werkzeug.contrib.cache import FileSystemCache, NullCache, md5
 from werkzeug.utils import import_string
 
+from . import codec
+from .timemap import Timemap
+from .utils import compress
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+NOT_FOUND_DAYS = 16
+"""Maximum number of days for which a URI-R is remembered not found."""
+
 
 class Cache(object):
     """Base class for TimeGate caches."""
 
     def __init__(self, cache_backend, cache_refresh_time=86400,
-                 max_file_size=0, **kwargs):
+                 max_file_size=0, cache_rendered=True,
+                 compress_rendered=False, fetch_wait_timeout=30,
+                 stale_while_revalidate=0, refresh_jitter=None,
+                 not_found_time=300, timemap_compression='zlib',
+                 memory_threshold=128, memory_max_size=64 * 1024 * 1024,
+                 full_refresh_merges=0, full_refresh_time=604800,
+                 stats_interval=3600, **kwargs):
         """Constructor method.
 
         :param cache_backend: Importable string pointing to cache class.
         :param max_file_size: (Optional) The maximum size (in Bytes) for a
         TimeMap cache value. When max_file_size=0, there is no limit to
         a cache value. When max_file_size=X > 0, the cache will not
-        store TimeMap that require more than X Bytes on disk.
+        store TimeMap, or rendered body, whose encoded bytes are more than
+        X Bytes.
+        :param cache_rendered: (Optional) Store the rendered TimeMap
+        bodies next to the TimeMaps. Default True.
+        :param compress_rendered: (Optional) Store the rendered bodies
+        gzip-compressed. Default False.
+        :param fetch_wait_timeout: (Optional) Number of seconds to wait for
+        another thread or process fetching the same TimeMap, see
+        :meth:`single_flight`. Default 30.
+        :param stale_while_revalidate: (Optional) Number of seconds after
+        the expiry of a TimeMap during which it is still served while it
+        is refreshed in the background. Default 0.
+        :param refresh_jitter: (Optional) Maximum number of seconds
+        randomly taken off the refresh time of each TimeMap so that
+        TimeMaps cached together do not expire together. Default a tenth
+        of the refresh time.
+        :param not_found_time: (Optional) Number of seconds during which
+        an original resource the handler found no memento for is not
+        looked up again. 0 disables it. Default 300.
+        :param timemap_compression: (Optional) Compression of the URI-Ms
+        of the stored TimeMaps, ``none``, ``zlib`` or ``lzma``, see
+        :mod:`timegate.codec`. Default ``zlib``.
+        :param memory_threshold: (Optional) Maximum number of TimeMaps
+        kept decoded in the memory of the process in front of the
+        backend. 0 disables it. Default 128.
+        :param memory_max_size: (Optional) Maximum total size in bytes of
+        the encoded TimeMaps kept in memory. Default 64 MiB.
+        :param full_refresh_merges: (Optional) Number of times new mementos
+        are merged into a cached TimeMap before it is fetched whole again,
+        see :meth:`full_fetch_due`. 0 disables it. Default 0.
+        :param full_refresh_time: (Optional) Number of seconds after which
+        a TimeMap is fetched whole again instead of merged. 0 disables it.
+        Default 604800 (a week).
+        :param stats_interval: (Optional) Number of seconds between two
+        logs of the ``stats`` counters of the process. 0 disables it.
+        Default 3600.
         """
         self.tolerance = relativedelta(seconds=cache_refresh_time)
+        self.stale_while_revalidate = timedelta(
+            seconds=stale_while_revalidate
+        )
+        self.refresh_jitter = cache_refresh_time // 10 \
+            if refresh_jitter is None else refresh_jitter
+        # Entries must outlive the window in which they are served stale,
+        # and be merged with newer mementos until a whole fetch is due,
+        # instead of falling back to the default timeout of the backend
+        self.timeout = cache_refresh_time + max(
+            stale_while_revalidate, full_refresh_time
+        ) if full_refresh_time else 0
         self.max_file_size = max(max_file_size, 0)
         self.CHECK_SIZE = self.max_file_size > 0
         self.backend = import_string(cache_backend)(**kwargs)
+        self.cache_rendered = cache_rendered and not isinstance(
+            self.backend, NullCache
+        )
+        self.memory = _MemoryCache(memory_threshold, memory_max_size) \
+            if memory_threshold and not isinstance(self.backend, NullCache) \
+            else None
+        self.compress_rendered = compress_rendered
+        self.fetch_wait_timeout = fetch_wait_timeout
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._revalidating = set()
+        self.not_found_time = not_found_time
+        self.full_refresh_merges = full_refresh_merges
+        self.full_refresh_time = timedelta(seconds=full_refresh_time)
+        self.timemap_compression = timemap_compression
+        if timemap_compression not in codec.COMPRESSIONS:
+            raise ValueError('Unknown TimeMap compression "{0}".'.format(
+                timemap_compression))
+        self.stats = Counter()
+        self.stats_interval = stats_interval
+        self._stats_logged = time.time()
+        self._stats_lock = threading.Lock()
 
-    def get_until(self, uri_r, date):
+    def get_until(self, uri_r, date, refresh=None):
         """Returns the TimeMap (memento,datetime)-list for the requested
         Memento. The TimeMap is guaranteed to span at least until the 'date'
         parameter, within the tolerance.
 
+        When ``refresh`` is given, a TimeMap that expired less than
+        ``stale_while_revalidate`` seconds before *date* is returned too,
+        and it is refreshed once in a background thread.
+
         :param uri_r: The URI-R of the resource as a string.
         :param date: The target date. It is the accept-datetime for TimeGate
         requests, and the current date. The cache will return all
         Mementos prior to this date (within cache.tolerance parameter)
-        :return: [(memento_uri_string, datetime_obj),...] list if it is
-        in cache and if it is within the cache tolerance for *date*,
-        None otherwise.
+        :param refresh: (Optional) Function fetching, caching and returning
+        the TimeMap, see :meth:`single_flight`.
+        :return: The :class:`~timegate.timemap.Timemap` if it is in cache
+        and if it is within the cache tolerance for *date*, None otherwise.
         """
         # Query the backend for stored cache values to that memento
-        val = self.backend.get(uri_r)
+        val = self._get(uri_r, date)
         if val:  # There is a value in the cache
             timestamp, timemap = val
-            if date <= timestamp + self.tolerance:
+            expires = self._expires(uri_r, timestamp)
+            if date <= expires:
+                self._count('hits')
+                timemap.timestamp = timestamp
                 return timemap
+            if refresh is not None and \
+                    date <= expires + self.stale_while_revalidate:
+                self._count('stale_hits')
+                self._revalidate(uri_r, refresh)
+                timemap.timestamp = timestamp
+                return timemap
+        self._count('misses')
 
-    def get_all(self, uri_r):
+    def get_all(self, uri_r, refresh=None):
         """Request the whole TimeMap for that uri.
 
         :param uri_r: the URI-R of the resource.
-        :return: [(memento_uri_string, datetime_obj),...] list if it is in
-        cache and if it is within the cache tolerance, None otherwise.
+        :param refresh: (Optional) Function refreshing a stale TimeMap, see
+        :meth:`get_until`.
+        :return: The :class:`~timegate.timemap.Timemap` if it is in cache
+        and if it is within the cache tolerance, None otherwise.
         """
         until = datetime.utcnow().replace(tzinfo=tzutc())
-        return self.get_until(uri_r, until)
+        return self.get_until(uri_r, until, refresh=refresh)
+
+    def peek(self, uri_r):
+        """Return the cached TimeMap of a URI-R, even if it expired.
+
+        :param uri_r: the URI-R of the resource.
+        :return: The :class:`~timegate.timemap.Timemap` if the backend
+        still holds it, None otherwise.
+        """
+        val = self._get(uri_r)
+        if val:
+            timestamp, timemap = val
+            timemap.timestamp = timestamp
+            return timemap
+
+    def _get(self, uri_r, date=None):
+        """Return the stored ``(timestamp, timemap)`` of a URI-R.
+
+        The TimeMap kept in memory is used unless it expired before
+        ``date``, the backend may then hold a fresher one.  Copies of it
+        are returned so that it does not grow when their URI-Ms are
+        decoded.  TimeMaps stored before they were encoded are returned
+        as is and the lists of ``(uri, datetime)`` tuples stored by the
+        first versions are converted, or deleted if they cannot be.
+        """
+        val = self.memory.get(uri_r) if self.memory else None
+        if val is not None and (
+                date is None or date <= self._expires(uri_r, val[0])):
+            self._count('memory_hits')
+            return val[0], val[1].copy()
+        val = self.backend.get(uri_r)
+        if not val:
+            return None
+        if codec.is_encoded(val[1]):
+            timemap = codec.decode(val[1])
+            if self.memory:
+                self.memory.set(uri_r, (val[0], timemap), len(val[1]))
+            return val[0], timemap.copy()
+        if not isinstance(val[1], Timemap):
+            try:
+                return val[0], Timemap.from_mementos(val[1])
+            except (TypeError, ValueError):
+                self.backend.delete(uri_r)
+                return None
+        return val
+
+    def get_not_found(self, uri_r, date=None):
+        """Return why the handler found no memento for a URI-R.
+
+        The answers of a URI-R are stored together under one key, the one
+        for all datetimes and up to :data:`NOT_FOUND_DAYS` for days.
+
+        :param uri_r: the URI-R of the resource.
+        :param date: (Optional) The datetime asked for. The answers for
+        its day are used too.
+        :return: The description of the handler error if it was raised
+        less than ``not_found_time`` seconds ago, None otherwise.
+        """
+        if not self.not_found_time:
+            return None
+        description = self._not_found(uri_r, date)
+        self._count('not_found_hits' if description is not None
+                    else 'not_found_misses')
+        return description
+
+    def _not_found(self, uri_r, date=None):
+        """Look up a URI-R without mementos, see :meth:`get_not_found`."""
+        entry = self.backend.get(self._not_found_key(uri_r)) or {}
+        for day in (None, _day(date)) if date is not None else (None, ):
+            description, expires = entry.get(day, (None, 0))
+            if description is not None and expires > time.time():
+                return description
+
+    def set_not_found(self, uri_r, description, date=None):
+        """Remember that the handler found no memento for a URI-R.
+
+        :param uri_r: the URI-R of the resource.
+        :param description: The description of the handler error.
+        :param date: (Optional) The datetime the handler found no memento
+        for, None when it found none at all.
+        """
+        if not self.not_found_time:
+            return
+        self._count('not_found_stored')
+        key = self._not_found_key(uri_r)
+        now = time.time()
+        entry = dict(
+            (day, value) for day, value in
+            (self.backend.get(key) or {}).items() if value[1] > now
+        )
+        day = _day(date) if date is not None else None
+        if day is not None and day not in entry:
+            days = sorted((value[1], day) for day, value in entry.items()
+                          if day is not None)
+            for _, oldest in days[:max(len(days) - NOT_FOUND_DAYS + 1, 0)]:
+                del entry[oldest]
+        entry[day] = (description, now + self.not_found_time)
+        self.backend.set(key, entry, timeout=self.not_found_time)
+
+    @staticmethod
+    def _not_found_key(uri_r):
+        """Return the backend key of a URI-R without mementos."""
+        return 'not_found|{0}'.format(uri_r)
+
+    def expired(self, uri_r, timestamp, stale=False):
+        """Return whether a TimeMap cached at ``timestamp`` expired.
+
+        :param uri_r: the URI-R of the resource.
+        :param timestamp: The timestamp of the cached TimeMap.
+        :param stale: (Optional) Whether it also left the window in which
+        it is served while it is refreshed.
+        """
+        expires = self._expires(uri_r, timestamp)
+        if stale:
+            expires += self.stale_while_revalidate
+        return datetime.utcnow().replace(tzinfo=tzutc()) > expires
+
+    def full_fetch_due(self, uri_r):
+        """Return whether the TimeMap of a URI-R must be fetched whole.
+
+        Merging the mementos archived since the latest cached one keeps
+        the mementos the archive deleted or corrected in the meantime, so
+        the whole TimeMap is fetched again after ``full_refresh_merges``
+        merges or ``full_refresh_time`` seconds.
+
+        :param uri_r: the URI-R of the resource.
+        """
+        if not self.full_refresh_merges and not self.full_refresh_time:
+            return False
+        fetched = self.backend.get(self._fetched_key(uri_r))
+        if not fetched:
+            return True
+        fetched_at, merges = fetched
+        if self.full_refresh_merges and merges >= self.full_refresh_merges:
+            return True
+        return bool(self.full_refresh_time) and \
+            datetime.utcnow().replace(tzinfo=tzutc()) >= \
+            fetched_at + self.full_refresh_time
+
+    @staticmethod
+    def _fetched_key(uri_r):
+        """Return the backend key of the latest whole fetch of a URI-R."""
+        return 'fetched|{0}'.format(uri_r)
+
+    def _count(self, key):
+        """Increment one of the ``stats`` counters, logging them at times."""
+        with self._stats_lock:
+            self.stats[key] += 1
+            now = time.time()
+            stats = None
+            if self.stats_interval and \
+                    now - self._stats_logged >= self.stats_interval:
+                self._stats_logged = now
+                stats = sorted(self.stats.items())
+        if stats is not None:
+            logging.info('Cache statistics of process %d: %s' % (
+                os.getpid(), ', '.join('%s %d' % item for item in stats)))
+
+    def _expires(self, uri_r, timestamp):
+        """Return the expiry datetime of a TimeMap cached at ``timestamp``.
+
+        The jitter is derived from the URI-R and the timestamp, so it is
+        the same in all processes and changes on every refresh.
+        """
+        expires = timestamp + self.tolerance
+        if self.refresh_jitter:
+            seed = '{0} {1}'.format(uri_r, timestamp.isoformat())
+            jitter = zlib.crc32(seed.encode('utf-8')) & 0xffffffff
+            expires -= timedelta(
+                seconds=self.refresh_jitter * jitter / float(0xffffffff)
+            )
+        return expires
+
+    def _revalidate(self, uri_r, refresh):
+        """Refresh a TimeMap in a background thread, once at a time."""
+        with self._flights_lock:
+            if uri_r in self._revalidating:
+                return
+            self._revalidating.add(uri_r)
+
+        def run():
+            try:
+                self.single_flight(uri_r, refresh)
+            except Exception as e:
+                logging.warning('Cannot refresh the TimeMap of %s: %s' % (
+                    uri_r, e))
+            finally:
+                with self._flights_lock:
+                    self._revalidating.discard(uri_r)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
 
-    def set(self, uri_r, timemap):
+    def set(self, uri_r, timemap, merged=None):
         """Set the cached TimeMap for that URI-R.
 
-        It appends it with a timestamp of when it is stored.
+        It appends it with a timestamp of when it is stored.  The TimeMap
+        is stored encoded by :func:`timegate.codec.encode`.
 
         :param uri_r: The URI-R of the original resource.
-        :param timemap: The value to cache.
+        :param timemap: The :class:`~timegate.timemap.Timemap` to cache.
+        :param merged: (Optional) For handlers whose TimeMaps are merged
+        when they expire, whether it is the cached one merged with newer
+        mementos or a whole one, see :meth:`full_fetch_due`.
         :return: The backend setter method return value.
         """
         timestamp = datetime.utcnow().replace(tzinfo=tzutc())
-        val = (timestamp, timemap)
-        if self._check_size(val):
-            self.backend.set(uri_r, val)
+        timemap.timestamp = timestamp
+        val = (timestamp, codec.encode(timemap, self.timemap_compression))
+        if self._check_size(len(val[1])):
+            self.backend.set(uri_r, val, timeout=self.timeout)
+            if self.memory:
+                self.memory.set(uri_r, (timestamp, codec.decode(val[1])),
+                                len(val[1]))
+            if self.not_found_time:
+                self.backend.delete(self._not_found_key(uri_r))
+            if merged is not None and (self.full_refresh_merges or
+                                       self.full_refresh_time):
+                # Time of the latest whole fetch and merges done since
+                key = self._fetched_key(uri_r)
+                fetched = self.backend.get(key) if merged else None
+                self.backend.set(key, (fetched[0], fetched[1] + 1)
+                                 if fetched else (timestamp, 0),
+                                 timeout=self.timeout)
+            if self.cache_rendered:
+                # Bodies rendered from former TimeMaps no longer match
+                self.backend.set(self._rendered_version_key(uri_r),
+                                 timestamp, timeout=self.timeout)
 
-    def _check_size(self, val):
-        """Check the size that a specific TimeMap value is using in memory.
+    def single_flight(self, uri_r, fetch, recheck=True):
+        """Fetch a TimeMap once for all the concurrent callers.
 
-        It deletes if it is more than the maximum size.
+        Threads of the same process asking for the same URI-R wait for the
+        first one and share its result or exception.  Processes wait for a
+        lock held in the backend, a file lock for ``FileSystemCache``, and
+        then look in the cache for the TimeMap the holder stored.  Waiting
+        is limited to ``fetch_wait_timeout`` seconds, after which callers
+        fetch the TimeMap themselves.
 
-        :param val: The cached object.
+        :param uri_r: The URI-R of the original resource.
+        :param fetch: Function fetching, caching and returning the TimeMap.
+        :param recheck: (Optional) Look in the cache once another process
+        has fetched the TimeMap. Default True.
+        :return: The :class:`~timegate.timemap.Timemap`.
+        """
+        with self._flights_lock:
+            flight = self._flights.get(uri_r)
+            leader = flight is None
+            if leader:
+                flight = self._flights[uri_r] = _Flight()
+        if not leader:
+            if not flight.done.wait(self.fetch_wait_timeout):
+                return fetch()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            with self._fetch_lock(uri_r) as waited:
+                result = self.get_all(uri_r) if waited and recheck else None
+                if result is None:
+                    result = fetch()
+            flight.result = result
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[uri_r]
+            flight.done.set()
+
+    @contextmanager
+    def _fetch_lock(self, uri_r):
+        """Hold the lock of the processes fetching a TimeMap.
+
+        It yields whether another process held the lock.  The lock is not
+        held if it cannot be acquired within ``fetch_wait_timeout``.
+        """
+        deadline = time.time() + self.fetch_wait_timeout
+        if isinstance(self.backend, NullCache):
+            yield False
+        elif isinstance(self.backend, FileSystemCache) and fcntl:
+            # The suffix keeps the lock files out of the backend pruning
+            path = '{0}.lock{1}'.format(self.backend._get_filename(uri_r),
+                                        self.backend._fs_transaction_suffix)
+            try:
+                # Sharded backends create subdirectories on first write
+                os.makedirs(os.path.dirname(path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            fd, waited = _lock_file(path, deadline)
+            try:
+                yield waited
+            finally:
+                if fd is not None:
+                    os.unlink(path)
+                    os.close(fd)
+        else:
+            key = 'lock|{0}'.format(uri_r)
+            timeout = int(self.fetch_wait_timeout) + 1
+            waited = False
+            acquired = self.backend.add(key, True, timeout=timeout)
+            while not acquired and time.time() < deadline:
+                waited = True
+                time.sleep(0.05)
+                acquired = self.backend.add(key, True, timeout=timeout)
+            try:
+                yield waited
+            finally:
+                if acquired:
+                    self.backend.delete(key)
+
+    def get_rendered(self, uri_r, response_type, encoding=None,
+                     base_url='', stale=False):
+        """Return the rendered body of a cached TimeMap.
+
+        The body shares the timestamp, and thus the tolerance, of the
+        TimeMap it was rendered from, and is only returned while that
+        TimeMap is the latest one stored.  Compressed bodies are produced
+        from the cached one the first time they are asked for and are
+        cached too.
+
+        :param uri_r: The URI-R of the original resource.
+        :param response_type: The format of the TimeMap.
+        :param encoding: (Optional) The content coding of the body, one
+        of :data:`~timegate.utils.CONTENT_ENCODINGS`.
+        :param base_url: (Optional) The scheme, server and script name the
+        links of the body were built for, bodies are stored per base URL.
+        :param stale: (Optional) Also return a body whose TimeMap expired
+        less than ``stale_while_revalidate`` seconds ago, see
+        :meth:`expired`.
+        :return: A ``(timestamp, digest, body)`` tuple with the timestamp
+        and digest of the TimeMap and the body as bytes if it is in cache
+        and within the cache tolerance, None otherwise.
+        """
+        if not self.cache_rendered:
+            return None
+        stored_gzip = self.compress_rendered and encoding == 'gzip'
+        if encoding and not stored_gzip:
+            cached = self._get_rendered(uri_r, response_type, encoding,
+                                        base_url, stale)
+            if cached is None:
+                cached = self.get_rendered(uri_r, response_type,
+                                           base_url=base_url, stale=stale)
+                if cached is not None:
+                    timestamp, digest, body = cached
+                    cached = timestamp, digest, compress(body, encoding)
+                    self._set_rendered(uri_r, response_type, encoding,
+                                       base_url, cached)
+            return cached
+
+        cached = self._get_rendered(uri_r, response_type, None, base_url,
+                                    stale)
+        if cached is not None and self.compress_rendered and not stored_gzip:
+            timestamp, digest, body = cached
+            body = gzip.GzipFile(fileobj=BytesIO(body)).read()
+            cached = timestamp, digest, body
+        return cached
+
+    def set_rendered(self, uri_r, response_type, body, timemap,
+                     encoding=None, base_url=''):
+        """Set the rendered body of a cached TimeMap.
+
+        :param uri_r: The URI-R of the original resource.
+        :param response_type: The format of the TimeMap.
+        :param body: The rendered body as bytes.
+        :param timemap: The cached :class:`~timegate.timemap.Timemap` it
+        was rendered from.
+        :param encoding: (Optional) The content coding the body is
+        compressed with.
+        :param base_url: (Optional) The base URL the links of the body were
+        built for, see :meth:`get_rendered`.
+        """
+        if not self.cache_rendered or timemap.timestamp is None:
+            return
+        if encoding is None and self.compress_rendered:
+            buf = BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(body)
+            body = buf.getvalue()
+        elif encoding == 'gzip' and self.compress_rendered:
+            return  # the body is already stored gzip-compressed
+        self._set_rendered(uri_r, response_type, encoding, base_url,
+                           (timemap.timestamp, timemap.digest, body))
+
+    def _get_rendered(self, uri_r, response_type, encoding, base_url,
+                      stale=False):
+        """Return a stored rendered body if it is within the tolerance.
+
+        Bodies rendered from a TimeMap that has since been replaced are
+        ignored.
+        """
+        val, latest = self.backend.get_many(
+            self._rendered_key(uri_r, response_type, encoding, base_url),
+            self._rendered_version_key(uri_r),
+        )
+        if val and val[0] == latest:
+            timestamp, digest, body = val
+            until = datetime.utcnow().replace(tzinfo=tzutc())
+            expires = self._expires(uri_r, timestamp)
+            if stale:
+                expires += self.stale_while_revalidate
+            if until <= expires:
+                return timestamp, digest, body
+
+    def _set_rendered(self, uri_r, response_type, encoding, base_url, val):
+        """Store a ``(timestamp, digest, body)`` rendered value.
+
+        The version key is stored again if the backend dropped it, as the
+        TimeMap rendered may still be served from memory.
+        """
+        if self._check_size(len(val[2])):
+            self.backend.set(
+                self._rendered_key(uri_r, response_type, encoding, base_url),
+                val, timeout=self.timeout,
+            )
+            self.backend.add(self._rendered_version_key(uri_r), val[0],
+                             timeout=self.timeout)
+
+    @staticmethod
+    def _rendered_key(uri_r, response_type, encoding=None, base_url=''):
+        """Return the backend key of a rendered TimeMap body."""
+        if encoding:
+            return '{0}|{1}|{2}|{3}'.format(base_url, uri_r, response_type,
+                                            encoding)
+        return '{0}|{1}|{2}'.format(base_url, uri_r, response_type)
+
+    @staticmethod
+    def _rendered_version_key(uri_r):
+        """Return the backend key of the timestamp of the latest TimeMap.
+
+        Rendered bodies are only served while they carry that timestamp,
+        whatever base URL they were stored for.
+        """
+        return 'rendered|{0}'.format(uri_r)
+
+    def _check_size(self, size):
+        """Check the size of an encoded TimeMap or of a rendered body.
+
+        :param size: The number of bytes of the value to cache.
         :return: The True if it can be stored.
         """
         if self.CHECK_SIZE:
-            size = sys.getsizeof(val)
             if size > self.max_file_size:
+                logging.info('Value of %d bytes not cached, the maximum is '
+                             '%d.' % (size, self.max_file_size))
                 return False
         return True
+
+
+def _day(date):
+    """Return the UTC day of a datetime as an ISO 8601 string."""
+    return date.astimezone(tzutc()).date().isoformat()
+
+
+class _MemoryCache(object):
+    """Least recently used values kept in the memory of a process."""
+
+    def __init__(self, threshold, max_size):
+        """Bound the cache by a number of values and a total size."""
+        self.threshold = threshold
+        self.max_size = max_size
+        self.size = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return a value and mark it as the most recently used."""
+        with self._lock:
+            item = self._values.pop(key, None)
+            if item is None:
+                return None
+            self._values[key] = item
+            return item[0]
+
+    def set(self, key, value, size):
+        """Store a value of ``size`` bytes, evicting the least used."""
+        with self._lock:
+            item = self._values.pop(key, None)
+            if item is not None:
+                self.size -= item[1]
+            if self.max_size and size > self.max_size:
+                return
+            self._values[key] = (value, size)
+            self.size += size
+            while len(self._values) > self.threshold or \
+                    self.max_size and self.size > self.max_size:
+                _, (_, evicted) = self._values.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        """Remove all the values."""
+        with self._lock:
+            self._values.clear()
+            self.size = 0
+
+
+class _Flight(object):
+    """Fetch of a TimeMap shared by the threads of a process."""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = self.error = None
+
+
+def _lock_file(path, deadline):
+    """Acquire an exclusive lock on a file, creating it if needed.
+
+    Holders remove the file before releasing the lock, so the lock is
+    acquired again if the file was replaced in the meantime.
+
+    :param path: The path of the lock file.
+    :param deadline: The time after which to give up.
+    :return: A ``(fd, waited)`` tuple with the locked file descriptor, or
+        None if the deadline was reached, and whether the lock was held by
+        someone else.
+    """
+    waited = False
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    os.close(fd)
+                    raise
+            waited = True
+            if time.time() >= deadline:
+                os.close(fd)
+                return None, waited
+            time.sleep(0.05)
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd, waited
+        except OSError:
+            pass  # removed by the previous holder
+        os.close(fd)
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of TimeGate.
+# Copyright (C) 2016 CERN.
+#
+# TimeGate is free software; you can redistribute it and/or modify
+# it under the terms of the Revised BSD License; see LICENSE file for
+# more details.
+
+"""Binary encoding of the TimeMaps stored in the cache.
+
+An encoded TimeMap starts with a header holding the format version, the
+compression, the number of mementos and the digest.  It is followed by
+the epoch seconds as a column of little-endian 64-bit integers, the
+offsets of the URI blocks and the blocks themselves.
+
+The URI-Ms are front-coded in blocks of ``BLOCK_SIZE``: the first URI of
+a block is stored whole and each following one as the length of the
+prefix it shares with the previous URI plus the rest, lengths being
+packed at the smallest width that fits the block.  Blocks are compressed
+independently, so finding the best memento of a TimeMap only decodes the
+blocks of the few URI-Ms it needs.
+"""
+
+from __future__ import absolute_import, print_function
+
+import binascii
+import struct
+import sys
+import zlib
+from array import array
+
+from .timemap import EPOCH_TYPECODE, Timemap
+
+try:
+    import lzma
+except ImportError:  # pragma: no cover
+    lzma = None
+
+MAGIC = b'TGTM'
+"""Leading bytes of the encoded TimeMaps."""
+
+VERSION = 1
+"""Version of the encoding format."""
+
+BLOCK_SIZE = 256
+"""Number of URI-Ms front-coded together."""
+
+COMPRESSIONS = ('none', 'zlib', 'lzma')
+"""Compressions of the URI blocks, by identifier."""
+
+_HEADER = struct.Struct('<4sBBHI16s')
+
+
+def encode(timemap, compression=None):
+    """Encode a TimeMap.
+
+    :param timemap: The :class:`~timegate.timemap.Timemap` to encode.
+    :param compression: (Optional) ``zlib`` or ``lzma`` to compress the
+        URI-Ms. Defaults to no compression.
+    :return: The encoded TimeMap as bytes.
+    """
+    compression = compression or 'none'
+    compress = _compressors().get(compression)
+    if compress is None:
+        raise ValueError(
+            'Unknown or unavailable compression "{0}".'.format(compression)
+        )
+
+    uris = timemap.uris
+    blocks = [compress(_front_code(uris[start:start + BLOCK_SIZE]))
+              for start in range(0, len(uris), BLOCK_SIZE)]
+    offsets = [0]
+    for block in blocks:
+        offsets.append(offsets[-1] + len(block))
+
+    return b''.join([
+        _HEADER.pack(MAGIC, VERSION, COMPRESSIONS.index(compression),
+                     BLOCK_SIZE, len(uris),
+                     binascii.unhexlify(timemap.digest)),
+        _pack_int64(timemap.epochs),
+        _pack_int64(offsets),
+    ] + blocks)
+
+
+def decode(data):
+    """Decode a TimeMap encoded by :func:`encode`.
+
+    The epochs are decoded at once and the URI-Ms block by block as they
+    are needed.  When ``data`` is a :class:`memoryview`, for instance of
+    a memory-mapped file, the epochs are read in place where the platform
+    allows it and the URI blocks are only read when they are decoded.
+
+    :param data: The encoded TimeMap, as bytes or a :class:`memoryview`.
+    :return: The :class:`~timegate.timemap.Timemap`.
+    :raises ValueError: If the data is not an encoded TimeMap of a known
+        version.
+    """
+    if not is_encoded(data):
+        raise ValueError('Not an encoded TimeMap.')
+    _, version, compression, block_size, count, digest = \
+        _HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(
+            'Unsupported TimeMap encoding version {0}.'.format(version)
+        )
+
+    position = _HEADER.size
+    epochs = _int64_column(data[position:position + 8 * count])
+    position += 8 * count
+    number_of_blocks = -(-count // block_size)
+    offsets = _unpack_int64(
+        bytes(data[position:position + 8 * (number_of_blocks + 1)])
+    )
+    position += 8 * (number_of_blocks + 1)
+
+    timemap = Timemap(FrontCodedURIs(
+        data[position:], offsets, count, block_size,
+        _decompressors()[COMPRESSIONS[compression]],
+    ), epochs)
+    timemap._digest = binascii.hexlify(digest).decode('ascii')
+    return timemap
+
+
+def is_encoded(value):
+    """Return whether a cached value is an encoded TimeMap."""
+    return isinstance(value, (bytes, memoryview)) and \
+        bytes(value[:len(MAGIC)]) == MAGIC
+
+
+class FrontCodedURIs(object):
+    """Read-only sequence of the URI-Ms of an encoded TimeMap.
+
+    Blocks are decoded on access.  Only the latest one is kept, so that
+    reading the URI-Ms in order decodes each block once while the memory
+    used stays that of the encoded TimeMap.
+    """
+
+    __slots__ = ('data', 'offsets', 'count', 'block_size', 'decompress',
+                 '_last')
+
+    def __init__(self, data, offsets, count, block_size, decompress):
+        """Wrap the URI blocks of an encoded TimeMap."""
+        self.data = data
+        self.offsets = offsets
+        self.count = count
+        self.block_size = block_size
+        self.decompress = decompress
+        self._last = None
+
+    def __len__(self):
+        """Return the number of URI-Ms."""
+        return self.count
+
+    def __getitem__(self, index):
+        """Return the URI-M at a position."""
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('URI-M index out of range')
+        return self._block(index // self.block_size)[index % self.block_size]
+
+    def copy(self):
+        """Return a sequence sharing the encoded URI-Ms but no block."""
+        return self.__class__(self.data, self.offsets, self.count,
+                              self.block_size, self.decompress)
+
+    def decode_all(self):
+        """Return all the URI-Ms in a list."""
+        uris = []
+        for number in range(len(self.offsets) - 1):
+            uris.extend(self._decode(number))
+        return uris
+
+    def _block(self, number):
+        """Return the URI-Ms of a block."""
+        last = self._last
+        if last is None or last[0] != number:
+            last = self._last = number, self._decode(number)
+        return last[1]
+
+    def _decode(self, number):
+        """Decode the URI-Ms of a block."""
+        return _front_decode(
+            self.decompress(
+                self.data[self.offsets[number]:self.offsets[number + 1]]
+            ),
+            min(self.block_size, self.count - number * self.block_size),
+        )
+
+
+def _compressors():
+    """Return the block compression functions by name."""
+    compressors = {'none': bytes, 'zlib': zlib.compress}
+    if lzma is not None:
+        compressors['lzma'] = lzma.compress
+    return compressors
+
+
+def _decompressors():
+    """Return the block decompression functions by name."""
+    decompressors = {'none': bytes, 'zlib': zlib.decompress}
+    if lzma is not None:
+        decompressors['lzma'] = lzma.decompress
+    return decompressors
+
+
+def _front_code(uris):
+    """Front-code a block of URI-Ms.
+
+    The block holds the byte width of the lengths, the lengths of the
+    prefixes shared by each URI-M but the first with the previous one,
+    the lengths of the remaining suffixes and the UTF-8 suffixes.
+    Lengths are counted in characters.
+    """
+    prefixes, suffixes = [], []
+    previous = None
+    for uri in uris:
+        if previous is not None:
+            # Longest common prefix by bisection of the slices
+            low, high = 0, min(len(previous), len(uri))
+            while low < high:
+                middle = (low + high + 1) // 2
+                if previous[:middle] == uri[:middle]:
+                    low = middle
+                else:
+                    high = middle - 1
+            prefixes.append(low)
+            uri_suffix = uri[low:]
+        else:
+            uri_suffix = uri
+        suffixes.append(uri_suffix)
+        previous = uri
+    lengths = prefixes + [len(suffix) for suffix in suffixes]
+    width = _width(max(lengths))
+    return b''.join([
+        struct.pack('<B{0}{1}'.format(len(lengths), _WIDTHS[width]),
+                    width, *lengths),
+        u''.join(suffixes).encode('utf-8'),
+    ])
+
+
+def _front_decode(data, count):
+    """Decode a block of ``count`` URI-Ms coded by :func:`_front_code`."""
+    width = struct.unpack_from('<B', data)[0]
+    lengths = struct.unpack_from(
+        '<{0}{1}'.format(2 * count - 1, _WIDTHS[width]), data, 1
+    )
+    text = data[1 + width * (2 * count - 1):].decode('utf-8')
+    previous = text[:lengths[count - 1]]
+    uris = [previous]
+    position = len(previous)
+    for shared, length in zip(lengths[:count - 1], lengths[count:]):
+        end = position + length
+        previous = previous[:shared] + text[position:end]
+        position = end
+        uris.append(previous)
+    return uris
+
+
+_WIDTHS = {1: 'B', 2: 'H', 4: 'I'}
+
+
+def _width(value):
+    """Return the number of bytes needed by an unsigned length."""
+    return 1 if value < 0x100 else 2 if value < 0x10000 else 4
+
+
+def _pack_int64(values):
+    """Return integers as little-endian 64-bit integers."""
+    column = array(EPOCH_TYPECODE, values)
+    if column.itemsize != 8:  # pragma: no cover
+        return struct.pack('<{0}q'.format(len(column)), *column)
+    if sys.byteorder == 'big':  # pragma: no cover
+        column.byteswap()
+    return column.tobytes() if hasattr(column, 'tobytes') \
+        else column.tostring()
+
+
+def _int64_column(data):
+    """Return a column of little-endian 64-bit integers.
+
+    A :class:`memoryview` is cast in place when its layout matches the
+    native one, otherwise the integers are copied to an array.
+    """
+    if isinstance(data, memoryview) and hasattr(data, 'cast') and \
+            sys.byteorder == 'little' and struct.calcsize('q') == 8:
+        return data.cast('q')
+    return _unpack_int64(bytes(data))
+
+
+def _unpack_int64(data):
+    """Return an array of little-endian 64-bit integers."""
+    column = array(EPOCH_TYPECODE)
+    if column.itemsize != 8:  # pragma: no cover
+        column.extend(struct.unpack('<{0}q'.format(len(data) // 8), data))
+        return column
+    if hasattr(column, 'frombytes'):
+        column.frombytes(data)
+    else:  # pragma: no cover
+        column.fromstring(data)
+    if sys.byteorder == 'big':  # pragma: no cover
+        column.byteswap()
+    return column
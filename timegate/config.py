@@ -41,6 +41,15 @@ class Config(dict):
         self['STRICT_TIME'] = conf.getboolean('server', 'strict_datetime')
         if conf.has_option('server', 'api_time_out'):
             self['API_TIME_OUT'] = conf.getfloat('server', 'api_time_out')
+        if conf.has_option('server', 'keep_alive'):
+            self['KEEP_ALIVE'] = conf.getboolean('server', 'keep_alive')
+        if conf.has_option('server', 'timemap_page_size'):
+            self['TIMEMAP_PAGE_SIZE'] = conf.getint('server',
+                                                    'timemap_page_size')
+        if conf.has_option('server', 'batch_max_size'):
+            self['BATCH_MAX_SIZE'] = conf.getint('server', 'batch_max_size')
+        if conf.has_option('server', 'batch_workers'):
+            self['BATCH_WORKERS'] = conf.getint('server', 'batch_workers')
 
         # Handler configuration
         def build_handler(section):
@@ -55,6 +64,25 @@ class Config(dict):
             else:
                 output['RESOURCE_TYPE'] = 'snapshot'
 
+            # Always set so that the options of the default handler,
+            # flattened into the configuration, are not inherited
+            options = output['HANDLER_OPTIONS'] = {}
+            if conf.has_option(section, 'handlers'):
+                options['handlers'] = [
+                    name.strip() for name in
+                    conf.get(section, 'handlers').split(',') if name.strip()
+                ]
+                if conf.has_option(section, 'handler_timeout'):
+                    options['timeout'] = conf.getfloat(section,
+                                                       'handler_timeout')
+                if conf.has_option(section, 'handler_timeouts'):
+                    options['timeouts'] = dict(
+                        (name.strip(), float(seconds)) for name, seconds in (
+                            item.split('=', 1) for item in
+                            conf.get(section, 'handler_timeouts').split(',')
+                            if item.strip()
+                        )
+                    )
             if conf.has_option(section, 'use_timemap'):
                 output['USE_TIMEMAPS'] = conf.getboolean(section,
                                                          'use_timemap')
@@ -83,8 +111,22 @@ class Config(dict):
         options = {
             'cache_backend': None,
             'cache_refresh_time': None,
+            'cache_rendered': 'getboolean',
+            'compress_rendered': 'getboolean',
             'default_timeout': 'getint',
+            'fetch_wait_timeout': 'getfloat',
+            'full_refresh_merges': 'getint',
+            'full_refresh_time': 'getint',
+            'refresh_jitter': 'getint',
+            'scan_interval': 'getint',
+            'stale_while_revalidate': 'getint',
+            'stats_interval': 'getint',
+            'max_file_size': 'getint',
+            'max_size': 'getint',
+            'memory_max_size': 'getint',
+            'memory_threshold': 'getint',
             'mode': 'getint',
+            'not_found_time': 'getint',
             'port': 'getint',
             'threshold': 'getint',
         }
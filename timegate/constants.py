@@ -31,13 +31,32 @@ DATE_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
 # TimeMap max size (in URIs) safeguard
 TM_MAX_SIZE = 100000
 
+# Size (in characters) of the chunks of streamed TimeMap responses
+TIMEMAP_CHUNK_SIZE = 65536
+
+# Maximum number of mementos in a paged TimeMap response
+TIMEMAP_PAGE_SIZE = 10000
+
+# Number of URI-Rs whose rendered links are memoized by each handler
+LINK_CACHE_SIZE = 4096
+
+# Maximum number of items in a batch TimeGate request
+BATCH_MAX_SIZE = 10000
+
+# Number of URI-Rs of a batch TimeGate request resolved concurrently
+BATCH_WORKERS = 8
+
 # Server configuration
 HOST = None
 STRICT_TIME = True
 API_TIME_OUT = 6
+# When False, responses ask clients to close the connection
+KEEP_ALIVE = True
 
 # Handler configuration
 HANDLER_MODULE = 'simple'
+# Keyword arguments of the handler constructor
+HANDLER_OPTIONS = {}
 BASE_URI = ''
 RESOURCE_TYPE = 'vcs'
 USE_TIMEMAPS = True
@@ -49,8 +68,8 @@ CACHE_USE = False
 CACHE_TOLERANCE = 86400
 # Cache files paths
 CACHE_DIRECTORY = 'cache'
-# Maximum number of TimeMaps stored in cache
-CACHE_MAX_VALUES = 250
+# Maximum number of entries (TimeMaps, rendered bodies, bookkeeping) in cache
+CACHE_MAX_VALUES = 1000
 # Cache files paths
 CACHE_FILE = CACHE_DIRECTORY  # + '/cache_data'
 # Cache expiration (space bound) in seconds
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of TimeGate.
+# Copyright (C) 2016 CERN.
+#
+# TimeGate is free software; you can redistribute it and/or modify
+# it under the terms of the Revised BSD License; see LICENSE file for
+# more details.
+
+"""Example of an asynchronous handler, requires Python 3.5 or newer."""
+
+from __future__ import absolute_import, print_function
+
+import asyncio
+
+from timegate.errors import HandlerError
+from timegate.examples.simple import ExampleHandler
+
+
+class AsyncExampleHandler(ExampleHandler):
+
+    # With the ASGI application, ``async def`` methods are awaited on the
+    # event loop, outside of its threads, once for all the concurrent
+    # requests of a TimeMap.  A real handler would use an asynchronous
+    # HTTP client here.
+    async def get_all_mementos(self, uri_r):
+        await asyncio.sleep(0)
+        return ExampleHandler.get_all_mementos(self, uri_r)
+
+    async def get_memento(self, uri_r, req_datetime):
+        await asyncio.sleep(0)
+        if req_datetime.year < 1999:
+            raise HandlerError(
+                "Cannot server a Memento before 1999", status=404)
+        return ExampleHandler.get_all_mementos(self, uri_r)[-1]
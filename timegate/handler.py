@@ -13,14 +13,14 @@
 from __future__ import absolute_import, print_function
 
 import logging
-from operator import itemgetter
 
 import requests
 
 from . import utils as timegate_utils
-from ._compat import quote
+from ._compat import iscoroutine, quote, run_coroutine
 from .constants import API_TIME_OUT, TM_MAX_SIZE
 from .errors import HandlerError
+from .timemap import Timemap
 
 
 class Handler(object):
@@ -73,17 +73,22 @@ class Handler(object):
 def parsed_request(handler_function, *args, **kwargs):
     """Retrieve and parse the response from the ``Handler``.
 
-    This function is the point of entry to all handler requests.
+    This function is the point of entry to all handler requests.  The
+    coroutines returned by ``async def`` handler methods are run to
+    completion and :class:`~timegate.timemap.Timemap` responses are
+    returned as they are.
 
     :param handler_function: The function to call.
     :param args: Arguments to :handler_function:
     :param kwargs: Keywords arguments to :handler_function:
-    :return: A sorted [(URI_str, date_obj),...] list of all Mementos.
+    :return: A sorted :class:`~timegate.timemap.Timemap` of all Mementos.
         In the response, and all URIs/dates are valid.
     :raise HandlerError: In case of a bad response from the handler.
     """
     try:
         handler_response = handler_function(*args, **kwargs)
+        if iscoroutine(handler_response):
+            handler_response = run_coroutine(handler_response)
     except HandlerError as he:
         logging.info('Handler raised HandlerError %s' % he)
         raise he  # HandlerErrors have return data.
@@ -94,6 +99,9 @@ def parsed_request(handler_function, *args, **kwargs):
     # Input check
     if not handler_response:
         raise HandlerError('Not Found: Handler response Empty.', 404)
+    elif isinstance(handler_response, Timemap):
+        # Already validated and sorted, as merged by the aggregator
+        return handler_response
     elif isinstance(handler_response, tuple):
         handler_response = [handler_response]
     elif not (isinstance(handler_response, list) and
@@ -111,4 +119,4 @@ def parsed_request(handler_function, *args, **kwargs):
         timegate_utils.validate_date(date)
     ) for (url, date) in handler_response or []]
     # Sort by datetime
-    return sorted(valid_response, key=itemgetter(1))
+    return Timemap.from_mementos(valid_response)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of TimeGate.
+# Copyright (C) 2016 CERN.
+#
+# TimeGate is free software; you can redistribute it and/or modify
+# it under the terms of the Revised BSD License; see LICENSE file for
+# more details.
+
+"""Compact representation of a TimeMap."""
+
+from __future__ import absolute_import, print_function
+
+import calendar
+import hashlib
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+from dateutil.tz import tzutc
+
+EPOCH = datetime(1970, 1, 1, tzinfo=tzutc())
+"""UNIX epoch as a timezone aware datetime."""
+
+try:
+    array('q')
+    EPOCH_TYPECODE = 'q'
+except ValueError:  # pragma: no cover
+    EPOCH_TYPECODE = 'l'  # Python 2 has no 'long long' arrays
+
+
+def to_epoch(value):
+    """Return the number of seconds since the UNIX epoch.
+
+    :param value: A datetime object, naive datetimes are considered to be
+        UTC, or a number of seconds that is returned unchanged.
+    :return: The number of seconds as an integer.
+    """
+    if isinstance(value, datetime):
+        return calendar.timegm(value.utctimetuple())
+    return int(value)
+
+
+def from_epoch(seconds):
+    """Return the UTC datetime for a number of seconds since the epoch."""
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class Timemap(object):
+    """Sorted list of mementos stored in compact arrays.
+
+    The datetimes are kept as integer seconds since the UNIX epoch in an
+    :class:`array.array` and the URI-Ms in a plain list.  Mementos are
+    exposed as ``(uri, datetime)`` tuples so a ``Timemap`` can be used
+    wherever a sorted list of tuples is expected.
+
+    ``timestamp`` is the datetime at which the TimeMap was stored in the
+    cache, ``None`` if it was not.
+    """
+
+    __slots__ = ('_uris', '_coded_uris', 'epochs', 'timestamp', '_digest')
+
+    def __init__(self, uris=None, epochs=None):
+        """Build a TimeMap from URI-Ms and their sorted epoch seconds.
+
+        :param uris: Iterable of URI-M strings, or the
+            :class:`~timegate.codec.FrontCodedURIs` of a cached TimeMap
+            which are then decoded as they are needed.
+        :param epochs: Iterable of integer seconds, sorted ascending.  A
+            :class:`memoryview` of 64-bit integers, for instance of a
+            memory-mapped cached TimeMap, is used without being copied.
+        """
+        if hasattr(uris, 'decode_all'):
+            self._uris, self._coded_uris = None, uris
+        else:
+            self._uris, self._coded_uris = list(uris or []), None
+        self.epochs = epochs if isinstance(epochs, memoryview) \
+            else array(EPOCH_TYPECODE, epochs or [])
+        self.timestamp = None
+        self._digest = None
+        assert len(self._uris if self._uris is not None
+                   else self._coded_uris) == len(self.epochs)
+
+    @classmethod
+    def from_mementos(cls, mementos):
+        """Build a TimeMap from ``(uri, datetime)`` tuples.
+
+        :param mementos: Iterable of tuples, in any order.
+        :return: A sorted :class:`Timemap`.
+        """
+        pairs = sorted(((uri, to_epoch(dt)) for uri, dt in mementos),
+                       key=itemgetter(1))
+        return cls([uri for uri, _ in pairs], [epoch for _, epoch in pairs])
+
+    @classmethod
+    def merge(cls, *timemaps):
+        """Merge sorted TimeMaps into a new one.
+
+        URI-Ms listed in several TimeMaps are only kept once, at their
+        earliest datetime.
+
+        :param timemaps: Sorted :class:`Timemap` objects.
+        :return: A sorted :class:`Timemap`.
+        """
+        seen = set()
+        uris, epochs = [], []
+        for epoch, uri in heapq.merge(*[
+                zip(timemap.epochs, timemap.uris) for timemap in timemaps
+        ]):
+            if uri not in seen:
+                seen.add(uri)
+                uris.append(uri)
+                epochs.append(epoch)
+        return cls(uris, epochs)
+
+    @property
+    def uris(self):
+        """Return the list of URI-Ms."""
+        if self._uris is None:
+            self._uris = self._coded_uris.decode_all()
+        return self._uris
+
+    @uris.setter
+    def uris(self, uris):
+        """Replace the list of URI-Ms."""
+        self._uris, self._coded_uris = uris, None
+
+    @property
+    def first(self):
+        """Return the oldest memento or ``None`` if the TimeMap is empty."""
+        return self[0] if self.epochs else None
+
+    @property
+    def last(self):
+        """Return the latest memento or ``None`` if the TimeMap is empty."""
+        return self[-1] if self.epochs else None
+
+    @property
+    def digest(self):
+        """Return the hexadecimal MD5 hash of the mementos.
+
+        It is computed once and kept when the TimeMap is pickled.
+        """
+        if self._digest is None:
+            md5 = hashlib.md5()
+            for uri in self.uris:
+                md5.update(uri.encode('utf-8'))
+                md5.update(b'\n')
+            epochs = self.epochs
+            md5.update(epochs.tobytes() if hasattr(epochs, 'tobytes')
+                       else epochs.tostring())
+            self._digest = md5.hexdigest()
+        return self._digest
+
+    def copy(self):
+        """Return a TimeMap with the same mementos, timestamp and digest.
+
+        The URI-Ms still coded are shared, so decoding those of the copy
+        does not make this TimeMap grow.
+        """
+        timemap = self.__class__(
+            self._uris if self._uris is not None
+            else self._coded_uris.copy(),
+            self.epochs,
+        )
+        timemap.timestamp = self.timestamp
+        timemap._digest = self._digest
+        return timemap
+
+    def bisect_left(self, value):
+        """Return the index of the first memento not before ``value``."""
+        return bisect_left(self.epochs, to_epoch(value))
+
+    def bisect_right(self, value):
+        """Return the index of the first memento strictly after ``value``."""
+        return bisect_right(self.epochs, to_epoch(value))
+
+    def __len__(self):
+        """Return the number of mementos."""
+        return len(self.epochs)
+
+    def __iter__(self):
+        """Iterate over ``(uri, datetime)`` tuples."""
+        for uri, epoch in zip(self.uris, self.epochs):
+            yield uri, from_epoch(epoch)
+
+    def __getitem__(self, index):
+        """Return a ``(uri, datetime)`` tuple or a sliced ``Timemap``."""
+        if isinstance(index, slice):
+            return self.__class__(self.uris[index], self.epochs[index])
+        uris = self._uris if self._uris is not None else self._coded_uris
+        return uris[index], from_epoch(self.epochs[index])
+
+    def __eq__(self, other):
+        """Compare mementos of both TimeMaps."""
+        if not isinstance(other, Timemap):
+            return NotImplemented
+        return self.epochs == other.epochs and self.uris == other.uris
+
+    def __ne__(self, other):
+        """Compare mementos of both TimeMaps."""
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __getstate__(self):
+        """Return the state for pickling."""
+        epochs = self.epochs
+        if isinstance(epochs, memoryview):
+            epochs = array(EPOCH_TYPECODE, epochs)
+        return self.uris, epochs, self._digest
+
+    def __setstate__(self, state):
+        """Restore a pickled state."""
+        self.uris, self.epochs = state[:2]
+        self._digest = state[2] if len(state) > 2 else None
+        self.timestamp = None
+
+    def __repr__(self):
+        """Representation of this class."""
+        return '<{0} {1} mementos>'.format(self.__class__.__name__, len(self))
@@ -13,13 +13,40 @@
 from __future__ import absolute_import, print_function
 
 import logging
+import time
+import zlib
 from datetime import datetime, timedelta
 
 from dateutil.parser import parse as parse_datestr
 from dateutil.tz import tzutc
+from werkzeug.http import parse_date
 
-from ._compat import urlparse
+from ._compat import lru_cache, text_type, urlparse
 from .errors import DateTimeError, URIRequestError
+from .timemap import Timemap, to_epoch
+
+CONTENT_ENCODINGS = ('gzip', 'deflate')
+"""Supported content codings, by order of preference."""
+
+_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+_MONTH_NUMBERS = dict((month, number + 1)
+                      for number, month in enumerate(_MONTHS))
+_UTC = tzutc()
+_HOURS_MINUTES = tuple('%02d:%02d:' % divmod(minutes, 60)
+                       for minutes in range(1440))
+_SECONDS = tuple('%02d GMT' % seconds for seconds in range(60))
+
+
+@lru_cache(maxsize=1024)
+def _http_day(days):
+    """Return the ``Wdy, DD Mon YYYY`` part of a date since the epoch."""
+    date = time.gmtime(days * 86400)
+    return '%s, %02d %s %04d ' % (_WEEKDAYS[date.tm_wday], date.tm_mday,
+                                  _MONTHS[date.tm_mon - 1], date.tm_year)
 
 
 def validate_uristr(uristr):
@@ -38,20 +65,181 @@ def validate_uristr(uristr):
 def validate_date(datestr):
     """Control and validate the date string.
 
-    :param datestr: The date string representation.
+    :param datestr: The date string representation, or a datetime object.
     :return: The datetime object form the parsed date string.
     """
+    if isinstance(datestr, datetime):
+        if datestr.tzinfo is None:
+            return datestr.replace(tzinfo=_UTC)
+        return datestr.astimezone(_UTC)
     return parse_datestr(datestr, fuzzy=True).replace(tzinfo=tzutc())
 
 
+def http_date(value=None):
+    """Format a UTC datetime as an RFC 1123 date.
+
+    The output is the same as :func:`werkzeug.http.http_date`.  The
+    ``Wdy, DD Mon YYYY`` part is computed once per day and kept in a small
+    LRU cache, as the mementos of a TimeMap are often close in time, and
+    the time part comes from lookup tables.
+
+    :param value: A datetime, naive datetimes are considered to be UTC,
+        or a number of seconds since the epoch. Defaults to now.
+    :return: The formatted date string.
+    """
+    if value is None:
+        epoch = int(time.time())
+    elif isinstance(value, datetime):
+        epoch = to_epoch(value)
+    else:
+        epoch = int(value)
+    days, seconds = divmod(epoch, 86400)
+    minutes, seconds = divmod(seconds, 60)
+    return _http_day(days) + _HOURS_MINUTES[minutes] + _SECONDS[seconds]
+
+
+def parse_http_date(value, strict=True):
+    """Parse an ``Accept-Datetime`` header value.
+
+    RFC 1123 dates are parsed by a dedicated fast parser.  When ``strict``
+    is false, the other HTTP date formats and any format understood by
+    :func:`validate_date` are accepted too.  Results are kept in a small
+    LRU cache as clients tend to repeat the same values.
+
+    :param value: The header value.
+    :param strict: Only accept RFC 1123 dates.
+    :return: A timezone aware UTC datetime.
+    :raises DateTimeError: If the value cannot be parsed.
+    """
+    return _parse_http_date(value.strip(), strict)
+
+
+@lru_cache(maxsize=1024)
+def _parse_http_date(value, strict):
+    """Parse a stripped header value, see :func:`parse_http_date`."""
+    result = _parse_rfc1123(value)
+    if result is None and not strict:
+        result = parse_date(value)
+        if result is not None:
+            result = result.replace(tzinfo=_UTC)
+        else:
+            try:
+                result = validate_date(value)
+            except (ValueError, OverflowError):
+                result = None
+    if result is None:
+        raise DateTimeError(
+            'Bad Accept-Datetime header, expected an RFC 1123 date such as '
+            '"Thu, 31 May 2007 20:35:00 GMT".'
+        )
+    return result
+
+
+def _parse_rfc1123(value):
+    """Parse a ``Wdy, DD Mon YYYY HH:MM:SS GMT`` date.
+
+    :return: A timezone aware datetime or None if the value is not an
+        RFC 1123 date.
+    """
+    if (len(value) != 29 or value[3:5] != ', ' or value[25:] != ' GMT' or
+            value[7] != ' ' or value[11] != ' ' or value[16] != ' ' or
+            value[19] != ':' or value[22] != ':' or
+            value[:3] not in _WEEKDAYS):
+        return None
+    month = _MONTH_NUMBERS.get(value[8:11])
+    digits = value[5:7] + value[12:16] + value[17:19] + value[20:22] + \
+        value[23:25]
+    if month is None or not digits.isdigit():
+        return None
+    try:
+        return datetime(int(value[12:16]), month, int(value[5:7]),
+                        int(value[17:19]), int(value[20:22]),
+                        int(value[23:25]), tzinfo=_UTC)
+    except ValueError:
+        return None
+
+
+def compress(data, encoding):
+    """Compress bytes for a content coding.
+
+    :param data: The bytes to compress.
+    :param encoding: One of :data:`CONTENT_ENCODINGS`.
+    :return: The compressed bytes.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _WBITS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_compressed(chunks, encoding):
+    """Compress a streamed body for a content coding.
+
+    :param chunks: Iterable of bytes or UTF-8 encoded strings.
+    :param encoding: One of :data:`CONTENT_ENCODINGS`.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _WBITS[encoding])
+    for chunk in chunks:
+        if isinstance(chunk, text_type):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 def best(timemap, accept_datetime, timemap_type):
-    """Find best memento."""
+    """Find best memento and its neighbours using binary search.
+
+    :param timemap: A sorted Timemap.
+    :param accept_datetime: The time object for which the best memento
+        must be found.
+    :param timemap_type: Either ``vcs`` or ``snapshot``.
+    :return: A ``(memento, prev, next)`` tuple of ``(uri, datetime)``
+        tuples.  ``prev`` and ``next`` are ``None`` when the best memento
+        is respectively the first or the last one.
+    """
     assert(timemap)
     assert(accept_datetime)
     if timemap_type == 'vcs':
-        return closest_before(timemap, accept_datetime)
+        index = _closest_before_index(timemap, accept_datetime)
     else:
-        return closest(timemap, accept_datetime)
+        index = _closest_index(timemap, accept_datetime)
+    prev_memento = timemap[index - 1] if index > 0 else None
+    next_memento = timemap[index + 1] if index + 1 < len(timemap) else None
+    return timemap[index], prev_memento, next_memento
+
+
+def paginate(timemap, from_datetime, until_datetime, page_size):
+    """Return the slice of a TimeMap between two datetimes.
+
+    The bounds are found by binary search and the slice holds at most
+    ``page_size`` mementos.  Mementos sharing the same datetime are never
+    split over two pages.
+
+    :param timemap: A sorted :class:`~timegate.timemap.Timemap`.
+    :param from_datetime: Datetime of the oldest memento of the page.
+    :param until_datetime: Datetime of the latest memento of the page.
+    :param page_size: Maximum number of mementos in the page.
+    :return: A ``(page, prev_bounds, next_bounds)`` tuple where the bounds
+        are ``(from_datetime, until_datetime)`` tuples of the neighbouring
+        pages, or ``None`` when there is no such page.
+    """
+    start = timemap.bisect_left(from_datetime)
+    end = stop = timemap.bisect_right(until_datetime)
+    prev_bounds = next_bounds = None
+
+    if stop - start > page_size:
+        epoch = timemap.epochs[start + page_size]
+        end = timemap.bisect_left(epoch)
+        if end <= start:
+            end = timemap.bisect_right(epoch)
+        if end < stop:
+            next_bounds = (timemap[end][1], until_datetime)
+
+    if start > 0:
+        prev_bounds = (timemap[max(start - page_size, 0)][1],
+                       timemap[start - 1][1])
+
+    return timemap[start:end], prev_bounds, next_bounds
 
 
 def closest(timemap, accept_datetime):
@@ -121,9 +309,9 @@ def closest_binary(timemap, accept_datetime):
     :param timemap: A sorted Timemap.
     :param accept_datetime: The time object for which the best memento
         must be found.
-    :return: The uri_m string of the closest memento.
+    :return: A tuple with memento URI and its datetime.
     """
-    # TODO implement
+    return timemap[_closest_index(timemap, accept_datetime)]
 
 
 def closest_before_binary(timemap, accept_datetime):
@@ -136,6 +324,43 @@ def closest_before_binary(timemap, accept_datetime):
     :param timemap: A sorted Timemap.
     :param accept_datetime: The time object for which the best memento
         must be found.
-    :return: The uri_m string of the closest memento.
+    :return: A tuple with memento URI and its datetime.
+    """
+    return timemap[_closest_before_index(timemap, accept_datetime)]
+
+
+def _bisect_right(timemap, accept_datetime):
+    """Return the index of the first memento strictly after a datetime."""
+    if isinstance(timemap, Timemap):
+        return timemap.bisect_right(accept_datetime)
+    lo, hi = 0, len(timemap)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if accept_datetime < timemap[mid][1]:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def _closest_index(timemap, accept_datetime):
+    """Return the index of the absolutely closest memento.
+
+    Ties are resolved like :func:`closest`, in favour of the latest memento.
+    """
+    index = _bisect_right(timemap, accept_datetime)
+    if index == len(timemap):
+        return index - 1
+    if index > 0 and (accept_datetime - timemap[index - 1][1] <
+                      timemap[index][1] - accept_datetime):
+        return index - 1
+    # Several mementos can share the datetime following accept_datetime.
+    return _bisect_right(timemap, timemap[index][1]) - 1
+
+
+def _closest_before_index(timemap, accept_datetime):
+    """Return the index of the closest memento before a datetime.
+
+    The first memento is returned if all of them are after the datetime.
     """
-    # TODO implement
+    return max(_bisect_right(timemap, accept_datetime) - 1, 0)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of TimeGate.
+# Copyright (C) 2016 CERN.
+#
+# TimeGate is free software; you can redistribute it and/or modify
+# it under the terms of the Revised BSD License; see LICENSE file for
+# more details.
+
+"""Warm up the TimeMap cache.
+
+The ``timegate-warm`` command reads URI-Rs, one per line, from files or
+the standard input.  Each one is routed to its handler by the URL map of
+the application like a ``/timemap/link/`` request, and its TimeMap is
+fetched and stored in the configured cache.  Several URI-Rs are fetched
+concurrently and progress is reported on the standard error::
+
+    $ timegate-warm -c config.ini -j 16 uris.txt
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import io
+import logging
+import sys
+import time
+from collections import Counter
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+
+from werkzeug.contrib.cache import NullCache
+from werkzeug.exceptions import HTTPException
+from werkzeug.local import release_local
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from .application import _RE_HANDLER, create_app, local
+
+OUTCOMES = ('cached', 'not_found', 'failed', 'skipped')
+"""Outcomes of warming the TimeMap of a URI-R."""
+
+READ_AHEAD = 4
+"""Number of URI-Rs read ahead per worker."""
+
+
+def warm(app, uri_rs, workers=8, refresh=False):
+    """Fetch and cache the TimeMaps of URI-Rs.
+
+    TimeMaps already cached are not fetched again unless ``refresh`` is
+    true.  URI-Rs are read from ``uri_rs`` in batches of
+    :data:`READ_AHEAD` per worker, so that long lists are not held in
+    memory.
+
+    :param app: The :class:`~timegate.application.TimeGate` application.
+    :param uri_rs: Iterable of URI-Rs.
+    :param workers: (Optional) Number of TimeMaps fetched concurrently.
+    :param refresh: (Optional) Fetch the TimeMaps even if they are cached,
+        as requests with ``Cache-Control: no-cache`` do.
+    :return: An iterator of ``(uri_r, outcome)`` tuples, in the order in
+        which they complete.  The outcome is one of :data:`OUTCOMES`:
+        ``skipped`` when no handler serves TimeMaps for the URI-R.
+    """
+    adapter = app.url_map.bind('localhost')
+    environ = EnvironBuilder(
+        headers=[('Cache-Control', 'no-cache')] if refresh else []
+    ).get_environ()
+
+    def fetch(uri_r):
+        local.request = Request(dict(environ))
+        try:
+            try:
+                endpoint, values = adapter.match('/timemap/link/' + uri_r,
+                                                 method='GET')
+            except HTTPException:
+                return uri_r, 'skipped'
+            handler = app.handlers[
+                _RE_HANDLER.match(endpoint).group('handler_name')
+            ]
+            if not handler.use_timemaps:
+                return uri_r, 'skipped'
+            app.get_all_mementos(values['uri_r'], handler=handler)
+            return uri_r, 'cached'
+        except HTTPException as e:
+            if e.code == 404:
+                return uri_r, 'not_found'
+            logging.warning('Fetching the TimeMap of %s failed: %s',
+                            uri_r, e.description)
+            return uri_r, 'failed'
+        except Exception:
+            logging.exception('Fetching the TimeMap of %s failed.', uri_r)
+            return uri_r, 'failed'
+        finally:
+            release_local(local)
+
+    if workers <= 1:
+        for uri_r in uri_rs:
+            yield fetch(uri_r)
+        return
+    uri_rs = iter(uri_rs)
+    pool = ThreadPool(workers)
+    try:
+        while True:
+            batch = list(islice(uri_rs, workers * READ_AHEAD))
+            if not batch:
+                break
+            for result in pool.imap_unordered(fetch, batch, chunksize=1):
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def read_uris(files):
+    """Yield the URI-Rs listed in files.
+
+    Blank lines and lines starting with ``#`` are ignored.  URI-Rs listed
+    twice are yielded twice, the second time their TimeMap is cached.
+
+    :param files: Iterable of file objects with one URI-R per line.
+    """
+    for f in files:
+        for line in f:
+            uri_r = line.strip()
+            if uri_r and not uri_r.startswith('#'):
+                yield uri_r
+
+
+def main(argv=None):
+    """Run the ``timegate-warm`` command.
+
+    :param argv: (Optional) The command line arguments. Defaults to
+        ``sys.argv[1:]``.
+    :return: The exit status, 1 if some TimeMaps could not be fetched or
+        if the cache is disabled.
+    """
+    parser = argparse.ArgumentParser(
+        prog='timegate-warm',
+        description='Fetch the TimeMaps of URI-Rs into the TimeGate cache.',
+    )
+    parser.add_argument(
+        'files', nargs='*', metavar='FILE', default=['-'],
+        help='files listing one URI-R per line, "-" for the standard '
+        'input (default)',
+    )
+    parser.add_argument(
+        '-c', '--config', help='path to the INI configuration file',
+    )
+    parser.add_argument(
+        '-j', '--workers', type=int,
+        help='number of TimeMaps fetched concurrently (default: '
+        'batch_workers of the configuration)',
+    )
+    parser.add_argument(
+        '--refresh', action='store_true',
+        help='fetch TimeMaps that are already cached too',
+    )
+    parser.add_argument(
+        '--interval', type=float, default=5,
+        help='seconds between two progress reports (default: 5)',
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig()
+
+    app = create_app(args.config)
+    if isinstance(app.cache.backend, NullCache):
+        logging.error('The cache is disabled, set cache_backend in the '
+                      'configuration to warm it up.')
+        return 1
+    workers = args.workers or app.config['BATCH_WORKERS']
+    files = [io.open(sys.stdin.fileno(), encoding='utf-8', closefd=False)
+             if name == '-' else io.open(name, encoding='utf-8')
+             for name in args.files]
+
+    counts = Counter()
+    start = reported = time.time()
+    try:
+        for _, outcome in warm(app, read_uris(files), workers=workers,
+                               refresh=args.refresh):
+            counts[outcome] += 1
+            now = time.time()
+            if now - reported >= args.interval:
+                reported = now
+                _report(counts, now - start)
+    finally:
+        for f in files:
+            f.close()
+    _report(counts, time.time() - start)
+    return 1 if counts['failed'] else 0
+
+
+def _report(counts, elapsed):
+    """Write the progress of the warm-up to the standard error."""
+    total = sum(counts.values())
+    print('{0} URI-Rs in {1:.1f}s ({2:.1f}/s): {3}'.format(
+        total, elapsed, total / elapsed if elapsed else 0.0,
+        ', '.join('{0} {1}'.format(counts[outcome],
+                                   outcome.replace('_', ' '))
+                  for outcome in OUTCOMES),
+    ), file=sys.stderr)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())